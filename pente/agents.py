@@ -1,11 +1,28 @@
 # multiAgents.py
 # --------------
 
+import copy
+import json
+import logging
+import math
+import multiprocessing
 import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
 
 from game import Agent
+from transposition import TranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+from ordering import MoveOrderer
+from stats import SearchStats
+from book import OpeningBook
+from cache import EvaluationCache
+import features
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 class cliAgent(Agent):
     def getAction(self, gameState):
@@ -69,92 +86,893 @@ class ReflexAgent(Agent):
 
 class MultiAgentSearchAgent(Agent):
 
-    def __init__(self, evalFn='scoreEvaluationFunction', depth='2'):
+    def __init__(self, evalFn='scoreEvaluationFunction', depth='2', evalCacheSize=None):
         self.index = 0  
-        self.evaluationFunction = betterEvaluationFunction
+        # evalFn names an evaluation function in this module, or is one
+        if callable(evalFn):
+            self.evaluationFunction = evalFn
+        else:
+            self.evaluationFunction = globals().get(evalFn, betterEvaluationFunction)
+        # with evalCacheSize, leaf values are memoized across the whole game
+        if evalCacheSize:
+            self.evaluationFunction = EvaluationCache(self.evaluationFunction, evalCacheSize)
         self.depth = int(depth)
 
 
 class MinimaxAgent(MultiAgentSearchAgent):
+    """
+    Full minimax search. With batchLeaves, the children of each last-ply node
+    are scored together by batchEvaluationFunction instead of one at a time;
+    it computes betterEvaluationFunction, so batchLeaves needs that as the
+    evaluation function, without an evaluation cache. Since the state keeps
+    its run counts up to date, scalar evaluation is O(1) and usually faster;
+    batching only pays off when evaluating a leaf from scratch is costly.
+
+    Exact node values are kept in a transposition table of tableSize slots for
+    the whole game, so positions searched for an earlier move are not searched
+    again to the same depth.
+    """
+
+    def __init__(self, evalFn='scoreEvaluationFunction', depth='2', batchLeaves=False, tableSize=2**16,
+                 evalCacheSize=None):
+        super().__init__(evalFn, depth, evalCacheSize)
+        if batchLeaves and self.evaluationFunction is not betterEvaluationFunction:
+            raise ValueError("batchLeaves scores leaves with betterEvaluationFunction, "
+                             "so it needs that evaluation function and no evaluation cache")
+        self.batchLeaves = batchLeaves
+        self.transpositionTable = TranspositionTable(tableSize)
 
     def getAction(self, gameState) -> str:
+        table = self.transpositionTable
+        table.newSearch()
 
         def get_V_minmax(agent_idx: int, gameState, depth: int) -> int:
-            actions = gameState.getLegalActions(agent_idx)
+            key = gameState.getHash() # covers the agent to move, which is agent_idx
+            entry = table.lookup(key)
+            if entry is not None and entry[0] == depth:
+                return entry[2]
+            value = get_V_minmax_uncached(agent_idx, gameState, depth)
+            table.store(key, depth, EXACT, value, None)
+            return value
+
+        def get_V_minmax_uncached(agent_idx: int, gameState, depth: int) -> int:
+            actions = gameState.getCandidateActions(agent_idx)
             if gameState.isWin() or gameState.isLose() or len(actions) == 0 or depth == 0: # terminal state
-                return betterEvaluationFunction(gameState)
-            else: # find V_minmax through recursion on actions
-                successors = [gameState.generateSuccessor(agent_idx, action) for action in actions]
-                if agent_idx == 0: # max agent
-                    scores = [get_V_minmax(1, succ, depth) for succ in successors]
-                    return max(scores)
-                elif agent_idx == 1: # min agent
-                    scores = [get_V_minmax(0, succ, depth - 1) for succ in successors]
-                    return min(scores)
-                else:
-                    raise Exception("unknown agent")
+                return self.evaluationFunction(gameState)
+            elif self.batchLeaves and agent_idx == 1 and depth == 1: # every child is a leaf
+                snapshots = []
+                for action in actions:
+                    gameState.makeMove(agent_idx, action)
+                    snapshots.append(features.snapshot(gameState))
+                    gameState.undoMove()
+                return float(batchEvaluationFunction([gameState], snapshots)[1].min())
+            else: # find V_minmax through recursion on actions, moving in place
+                scores = []
+                for action in actions:
+                    gameState.makeMove(agent_idx, action)
+                    if agent_idx == 0: # max agent
+                        scores.append(get_V_minmax(1, gameState, depth))
+                    elif agent_idx == 1: # min agent
+                        scores.append(get_V_minmax(0, gameState, depth - 1))
+                    else:
+                        raise Exception("unknown agent")
+                    gameState.undoMove()
+                return max(scores) if agent_idx == 0 else min(scores)
 
-        legalMoves = gameState.getLegalActions(1)
-        successors = [gameState.generateSuccessor(1, action) for action in legalMoves]
-        scores = [get_V_minmax(0, succ, self.depth) for succ in successors] 
-        bestScore = min(scores)
+        state = gameState.copy() # search works in place on a private copy
+        agentIndex = state.data.turn # the Game sets the turn of the agent to move
+        legalMoves = state.getCandidateActions(agentIndex)
+        scores = []
+        for action in legalMoves:
+            state.makeMove(agentIndex, action)
+            scores.append(get_V_minmax(1 - agentIndex, state, self.depth))
+            state.undoMove()
+        bestScore = max(scores) if agentIndex == 0 else min(scores)
         bestIndices = [index for index in range(
             len(scores)) if scores[index] == bestScore]
         chosenIndex = random.choice(bestIndices)
         return legalMoves[chosenIndex]
 
 
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when the agent's move time has run out.
+    """
+    pass
+
+
 class AlphaBetaAgent(MultiAgentSearchAgent):
+    """
+    Alpha-beta search to a fixed depth, or, when moveTime (seconds) is given,
+    iterative deepening that returns the best move of the deepest iteration
+    finished within the move time.
+
+    With workers > 1 the root moves are searched in a process pool. Workers
+    share the best root score found so far, so later root moves are searched
+    with that bound and still cut off; the chosen move is the same as with a
+    serial search.
+
+    With collectStats, every move records a SearchStats in self.stats and logs
+    it as an INFO record of this module's logger. Without it self.stats stays
+    None and the search only pays for the None checks.
+
+    With ponder, after each move the agent predicts the opponent's reply and
+    searches the resulting position in a background thread while the opponent
+    thinks, sharing the agent's tables. If the opponent plays the predicted
+    reply the pondered move is returned as soon as that search finishes;
+    otherwise the search is stopped and its table entries help the real one.
+    Pondering is serial and is not used together with workers.
+
+    book, an OpeningBook or the path of a book file, is consulted before any
+    search; positions found in it are answered without searching.
+
+    With pvs, the search is principal variation search: the first child of a
+    node gets the full window and the others a null window, which only proves
+    them no better; only a child that fails high is searched again. With
+    aspiration (in evaluation units) and a moveTime, each iteration searches
+    a window of that half-width around the previous iteration's score and
+    searches again with the full window if the score falls outside it.
+    Neither changes the chosen move, only the work.
+
+    After every move self.principalVariation holds the expected line of play,
+    starting with the chosen move. Where the search answered a node from the
+    transposition table, the line is continued with the moves the table
+    stores.
+    """
+
+    def __init__(self, evalFn='scoreEvaluationFunction', depth='2', tableSize=2**16, moveTime=None, maxDepth=None,
+                 workers=None, progress=True, collectStats=False, ponder=False, book=None, evalCacheSize=None,
+                 pvs=False, aspiration=None):
+        super().__init__(evalFn, depth, evalCacheSize)
+        # kept across moves; entries from earlier searches are replaced first
+        self.transpositionTable = TranspositionTable(tableSize)
+        self.moveOrderer = MoveOrderer()
+        self.moveTime = moveTime
+        self.maxDepth = maxDepth
+        self.deadline = None
+        self.workers = workers
+        self.pool = None
+        self.rootBound = None
+        self.searchId = 0
+        self.progress = progress # show a progress bar over the root moves
+        self.collectStats = collectStats
+        self.stats = None
+        self.ponder = ponder and not (workers is not None and workers > 1)
+        self.stopped = False # set to stop a search from another thread
+        self.ponderer = None # the agent copy searching the pondered position
+        self.ponderState = None
+        self.ponderThread = None
+        self.book = OpeningBook(book) if isinstance(book, str) else book
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.pvLines = None # pvLines[depth]: the line below the node last searched at depth
+        self.rootLines = None # the line below each root move of the last completed search
+        self.principalVariation = None
     
     def getAction(self, gameState) -> str:
         """
           Returns the minimax action using self.depth and self.evaluationFunction
         """
+        if self.book is not None:
+            action = self.book.lookup(gameState)
+            if action is not None:
+                self.stopPondering()
+                self.principalVariation = [action]
+                return action
+        action = self.finishPondering(gameState)
+        if action is None:
+            self.newSearch()
+            action = self.timedSearch(gameState)
+        if self.stats is not None and logger.isEnabledFor(logging.INFO):
+            record = dict(self.stats.asDict(), agent=type(self).__name__, action=list(action),
+                          pv=[list(move) for move in self.principalVariation])
+            logger.info("search stats %s", json.dumps(record), extra={'searchStats': record})
+        if self.ponder:
+            self.startPondering(gameState, action)
+        return action
 
-        def get_V_minmax_ab(agent_idx: int, gameState, depth: int, alpha: int, beta: int) -> float:
-            actions = gameState.getLegalActions(agent_idx)
-            if gameState.isWin() or gameState.isLose() or len(actions) == 0 or depth == 0: # terminal state
-                return betterEvaluationFunction(gameState)
-            else: # find V_minmax through recursion on actions
-                if agent_idx == 0: # max agent
-                    value = float("-inf")
-                    best_action = ""
-                    for action in actions:
-                        successor = gameState.generateSuccessor(agent_idx, action)
-                        succ_value = get_V_minmax_ab(1, successor, depth - 1, alpha, beta)
-                        if succ_value >= value:
-                            value = succ_value
-                            best_action = action  
-                        if beta <= value:
-                            break
-                        alpha = max([alpha, value])
-                    return value
-
-                elif agent_idx == 1: # min agent
-                    value = float("inf")
-                    for action in actions:
-                        successor = gameState.generateSuccessor(agent_idx, action)
-                        succ_value = get_V_minmax_ab(0, successor, depth - 1, alpha, beta)
-                        if succ_value <= value:
-                            value = succ_value
-                        if value <= alpha:
-                            break
-                        beta = min([beta, value])
-                    return value
-                else:
-                    raise Exception("unknown agent")
+    def newSearch(self):
+        self.transpositionTable.newSearch()
+        self.moveOrderer.newSearch()
+        self.searchId += 1
+        self.deadline = None
+        self.stopped = False
+        self.stats = SearchStats() if self.collectStats else None
+
+    def timedSearch(self, gameState):
+        if self.stats is None:
+            return self.search(gameState)
+        tic = time.perf_counter()
+        action = self.search(gameState)
+        self.stats.totalTime = time.perf_counter() - tic
+        return action
+
+    def startPondering(self, gameState, action):
+        """
+        Predicts the opponent's reply to action, from the principal variation,
+        the transposition table or else the move ordering, and starts
+        searching the position after it in a background thread.
+        """
+        state = gameState.copy()
+        agentIndex = state.data.turn
+        state.makeMove(agentIndex, action)
+        replies = state.getCandidateActions(1 - agentIndex)
+        if not replies:
+            return
+        pv = self.principalVariation
+        if pv is not None and len(pv) > 1 and pv[0] == action:
+            reply = pv[1]
+        else:
+            entry = self.transpositionTable.lookup(state.getHash())
+            reply = entry[3] if entry is not None else None
+        if reply not in replies:
+            reply = self.moveOrderer.orderMoves(state, 1 - agentIndex, replies, 0)[0]
+        state.makeMove(1 - agentIndex, reply)
+        if state.isWin() or state.isLose():
+            return
 
-        legalMoves = gameState.getLegalActions(self.index + 1)
-        successors = [gameState.generateSuccessor(self.index + 1, action) for action in legalMoves]
+        # a shallow copy shares the tables but has its own deadline and stats,
+        # so stopping it cannot race with this agent's next search
+        ponderer = copy.copy(self)
+        ponderer.newSearch()
+        ponderer.progress = False
+        ponderer.ponder = False
+        self.ponderer = ponderer
+        self.ponderState = state
+        self.ponderThread = threading.Thread(target=ponderer.ponderSearch, args=(state,), daemon=True)
+        self.ponderThread.start()
+
+    def ponderSearch(self, state):
+        """
+        Body of the pondering thread; leaves the move in self.ponderAction, or
+        None if the search was stopped.
+        """
+        try:
+            self.ponderAction = self.timedSearch(state)
+        except SearchTimeout:
+            self.ponderAction = None
+
+    def stopPondering(self):
+        """
+        Stops the pondering search, if any, and waits for its thread.
+        """
+        if self.ponderThread is None:
+            return
+        self.ponderer.stopped = True
+        self.ponderer.deadline = 0.0 # already passed, so the search times out
+        self.ponderThread.join()
+        self.ponderer = self.ponderState = self.ponderThread = None
+
+    def finishPondering(self, gameState):
+        """
+        On a ponder hit, waits for the pondering search and returns its move;
+        otherwise stops it and returns None.
+        """
+        if self.ponderThread is None:
+            return None
+        if not gameState == self.ponderState:
+            self.stopPondering()
+            return None
+        self.ponderThread.join()
+        ponderer = self.ponderer
+        self.ponderer = self.ponderState = self.ponderThread = None
+        self.stats = ponderer.stats
+        self.principalVariation = ponderer.principalVariation
+        if self.stats is not None:
+            self.stats.ponderHit = True
+        return ponderer.ponderAction
+
+    def search(self, gameState):
+        state = gameState.copy() # search works in place on a private copy
+        agentIndex = state.data.turn # the Game sets the turn of the agent to move
+        legalMoves = state.getCandidateActions(agentIndex)
+        if self.moveTime is None:
+            scores = self.searchRoot(state, agentIndex, legalMoves, self.depth, progress=self.progress)
+            self.recordIteration(self.depth)
+            return self.choosePrincipalVariation(state, agentIndex, legalMoves, scores, self.depth)
+        return self.iterativeDeepening(state, agentIndex, legalMoves)
+
+    def recordIteration(self, depth):
+        """
+        Notes in the stats that the search to depth completed.
+        """
+        if self.stats is not None:
+            self.stats.depth = depth
+            self.stats.iterationNodes.append(self.stats.nodes - sum(self.stats.iterationNodes))
+
+    def iterativeDeepening(self, state, agentIndex, legalMoves):
+        """
+        Searches depth 0, 1, 2, ... until the move time runs out and returns
+        the move chosen by the deepest completed iteration. Each iteration
+        searches the previous iteration's choice first, within the aspiration
+        window around its score if the agent has one.
+        """
+        deadline = time.monotonic() + self.moveTime
+        max_depth = state.data.board_size ** 2 - sum(state.data.num_pieces)
+        if self.maxDepth is not None:
+            max_depth = min(max_depth, self.maxDepth)
+
+        self.deadline = None # the first iteration always completes
+        best_action = None
+        best_score = None
+        depth = 0
+        while depth <= max_depth:
+            if best_action is not None:
+                legalMoves = [best_action] + [action for action in legalMoves if action != best_action]
+            window = None
+            if self.aspiration is not None and best_score is not None and math.isfinite(best_score):
+                window = (best_score - self.aspiration, best_score + self.aspiration)
+            try:
+                scores = self.searchRoot(state, agentIndex, legalMoves, depth, window=window)
+                best_score = max(scores) if agentIndex == 0 else min(scores)
+                if window is not None and not window[0] < best_score < window[1]:
+                    # failed low or high: the scores are only bounds
+                    scores = self.searchRoot(state, agentIndex, legalMoves, depth)
+                    best_score = max(scores) if agentIndex == 0 else min(scores)
+            except SearchTimeout:
+                break # the state was left mid-tree, but it is a private copy
+            best_action = self.choosePrincipalVariation(state, agentIndex, legalMoves, scores, depth)
+            self.recordIteration(depth)
+            self.deadline = deadline
+            if self.stopped or time.monotonic() >= deadline:
+                break
+            depth += 1
+        self.deadline = None
+        return best_action
+
+    def searchRoot(self, state, agentIndex, legalMoves, depth, progress=False, window=None):
+        """
+        Returns the minimax value of every root move of agentIndex searched to
+        depth. Each move is searched with the best score so far as its bound
+        (see rootWindow): a move that cannot tie the best only gets a bound,
+        which is enough for chooseAction to pick from the same set of moves.
+        A window (low, high) narrows every move's bounds further; the scores
+        are then exact only if the best lies strictly inside it.
+
+        The line below each move is left in self.rootLines.
+        """
+        if self.workers is not None and self.workers > 1:
+            return self.searchRootParallel(state, agentIndex, legalMoves, depth, progress, window)
+        self.pvLines = [()] * (depth + 1)
         scores = []
-        for i in tqdm(range(len(successors)), desc="Calculating..."):
-            scores.append(get_V_minmax_ab(self.index, successors[i], self.depth, float("-inf"), float("inf")))
-        worstScore = min(scores)
+        lines = []
+        best = float("-inf") if agentIndex == 0 else float("inf")
+        moves = tqdm(legalMoves, desc="Calculating...") if progress else legalMoves
+        for action in moves:
+            state.makeMove(agentIndex, action)
+            (alpha, beta) = rootWindow(agentIndex, best, window)
+            if self.pvs and scores:
+                score = self.scout(agentIndex, state, depth, alpha, beta)
+            else:
+                score = self.get_V_minmax_ab(1 - agentIndex, state, depth, alpha, beta)
+            state.undoMove()
+            best = max(best, score) if agentIndex == 0 else min(best, score)
+            scores.append(score)
+            lines.append(self.pvLines[depth])
+        self.rootLines = lines
+        return scores
+
+    def searchRootParallel(self, state, agentIndex, legalMoves, depth, progress=False, window=None):
+        """
+        searchRoot with one pool task per root move.
+        """
+        if self.pool is None:
+            self.rootBound = multiprocessing.Value('d', math.inf)
+            config = {'evalFn': self.evaluationFunction, 'depth': self.depth,
+                      'tableSize': self.transpositionTable.size, 'collectStats': self.collectStats,
+                      'pvs': self.pvs}
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initRootWorker,
+                                            initargs=(config, self.rootBound))
+        with self.rootBound.get_lock():
+            self.rootBound.value = -math.inf if agentIndex == 0 else math.inf
+        futures = [self.pool.submit(searchRootMove, state, agentIndex, action, depth,
+                                    self.deadline, self.searchId, window) for action in legalMoves]
+        completed = as_completed(futures)
+        if progress:
+            completed = tqdm(completed, total=len(futures), desc="Calculating...")
+        for future in completed:
+            if future.exception() is not None: # a worker timed out; drop the moves not yet started
+                for other in futures:
+                    other.cancel()
+                raise future.exception()
+        results = [future.result() for future in futures]
+        if self.stats is not None:
+            for (score, stats, line) in results:
+                self.stats.merge(stats)
+        self.rootLines = [line for (score, stats, line) in results]
+        return [score for (score, stats, line) in results]
+
+    def close(self):
+        """
+        Stops pondering and shuts down the worker pool, if one was started.
+        """
+        self.stopPondering()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __getstate__(self):
+        fields = dict(self.__dict__)
+        fields['pool'] = None
+        fields['rootBound'] = None
+        fields['ponderer'] = fields['ponderState'] = fields['ponderThread'] = None
+        return fields
+
+    def chooseAction(self, agentIndex, legalMoves, scores):
+        bestScore = max(scores) if agentIndex == 0 else min(scores)
         indices = [index for index in range(
-            len(scores)) if scores[index] == worstScore]
+            len(scores)) if scores[index] == bestScore]
         chosenIndex = random.choice(indices)
         return legalMoves[chosenIndex]
 
+    def choosePrincipalVariation(self, state, agentIndex, legalMoves, scores, depth):
+        """
+        chooseAction, also setting self.principalVariation to the chosen move
+        followed by the line searched below it to depth.
+        """
+        action = self.chooseAction(agentIndex, legalMoves, scores)
+        line = [action] + list(self.rootLines[legalMoves.index(action)])
+        self.principalVariation = self.followTable(state, agentIndex, line, depth + 1)
+        return action
+
+    def followTable(self, state, agentIndex, line, plies):
+        """
+        Returns line, a list of moves from state starting with agentIndex's,
+        extended to at most plies moves by following the best moves stored in
+        the transposition table. A line from the search stops at the first
+        node answered from the table; the table's entry there continues it.
+        """
+        line = list(line)
+        for action in line:
+            state.makeMove(agentIndex, action)
+            agentIndex = 1 - agentIndex
+        played = len(line)
+        table = self.transpositionTable
+        while len(line) < plies and not (state.isWin() or state.isLose()):
+            entry = table.lookup(state.getHash())
+            if entry is None:
+                break
+            (entry_depth, flag, value, action) = entry
+            # a bound on the mover's losing side means no move reached the window
+            if flag == (UPPERBOUND if agentIndex == 0 else LOWERBOUND) \
+                    or action not in state.getCandidateActions(agentIndex):
+                break
+            state.makeMove(agentIndex, action)
+            agentIndex = 1 - agentIndex
+            line.append(action)
+            played += 1
+        for i in range(played):
+            state.undoMove()
+        return line
+
+    def get_V_minmax_ab(self, agent_idx: int, gameState, depth: int, alpha: int, beta: int) -> float:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchTimeout()
+        stats = self.stats
+        if stats is not None:
+            stats.nodes += 1
+        lines = self.pvLines
+        lines[depth] = () # until a child sets it, the line ends here
+        if gameState.isWin() or gameState.isLose() or depth == 0: # terminal state
+            if stats is not None:
+                return stats.evaluate(self.evaluationFunction, gameState)
+            return self.evaluationFunction(gameState)
+
+        # only cut off on entries searched to exactly this depth, so values
+        # (and the chosen move) match a search without the table
+        table = self.transpositionTable
+        key = gameState.getHash()
+        entry = table.lookup(key)
+        table_action = None
+        if stats is not None:
+            stats.tableProbes += 1
+            stats.tableHits += entry is not None
+        if entry is not None:
+            (entry_depth, flag, entry_value, table_action) = entry
+            if entry_depth == depth:
+                if flag == EXACT or (flag == LOWERBOUND and entry_value >= beta) \
+                        or (flag == UPPERBOUND and entry_value <= alpha):
+                    if stats is not None:
+                        stats.tableCutoffs += 1
+                    return entry_value
+
+        if stats is not None:
+            tic = time.perf_counter()
+        actions = gameState.getCandidateActions(agent_idx)
+        if len(actions) == 0:
+            if stats is not None:
+                return stats.evaluate(self.evaluationFunction, gameState)
+            return self.evaluationFunction(gameState)
+        # children are generated one at a time in search order, so a cutoff
+        # skips the ordering work for the moves after the table move
+        actions = self.moveOrderer.orderedMoves(gameState, agent_idx, actions, depth, table_action)
+        if stats is not None:
+            stats.generationTime += time.perf_counter() - tic
+
+        alpha_orig, beta_orig = alpha, beta
+        best_action = None # also marks that the first child has been searched
+        pvs = self.pvs
+        if agent_idx == 0: # max agent
+            value = float("-inf")
+            for action in actions:
+                if pvs and best_action is not None:
+                    succ_value = self.scoutChild(stats, agent_idx, action, gameState, depth, alpha, beta)
+                elif stats is None:
+                    gameState.makeMove(agent_idx, action)
+                    succ_value = self.get_V_minmax_ab(1, gameState, depth - 1, alpha, beta)
+                    gameState.undoMove()
+                else:
+                    succ_value = self.searchChild(stats, agent_idx, action, gameState, depth, alpha, beta)
+                # a later child that only ties may hold a fail-soft bound, so
+                # the best move changes on a strict improvement only
+                if succ_value > value or best_action is None:
+                    value = succ_value
+                    best_action = action
+                    if alpha < succ_value < beta: # exact, so the child's line is too
+                        lines[depth] = (action,) + lines[depth - 1]
+                if beta <= value:
+                    self.moveOrderer.recordCutoff(agent_idx, action, depth)
+                    if stats is not None:
+                        stats.cutoffs[depth] += 1
+                    break
+                alpha = max([alpha, value])
+
+        elif agent_idx == 1: # min agent
+            value = float("inf")
+            for action in actions:
+                if pvs and best_action is not None:
+                    succ_value = self.scoutChild(stats, agent_idx, action, gameState, depth, alpha, beta)
+                elif stats is None:
+                    gameState.makeMove(agent_idx, action)
+                    succ_value = self.get_V_minmax_ab(0, gameState, depth - 1, alpha, beta)
+                    gameState.undoMove()
+                else:
+                    succ_value = self.searchChild(stats, agent_idx, action, gameState, depth, alpha, beta)
+                if succ_value < value or best_action is None:
+                    value = succ_value
+                    best_action = action
+                    if alpha < succ_value < beta: # exact, so the child's line is too
+                        lines[depth] = (action,) + lines[depth - 1]
+                if value <= alpha:
+                    self.moveOrderer.recordCutoff(agent_idx, action, depth)
+                    if stats is not None:
+                        stats.cutoffs[depth] += 1
+                    break
+                beta = min([beta, value])
+        else:
+            raise Exception("unknown agent")
+
+        if value <= alpha_orig:
+            flag = UPPERBOUND
+        elif value >= beta_orig:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        table.store(key, depth, flag, value, best_action)
+        return value
+
+    def searchChild(self, stats, agent_idx, action, gameState, depth, alpha, beta):
+        """
+        The move, search and undo of one child in get_V_minmax_ab, with the
+        move and undo timed as successor creation.
+        """
+        tic = time.perf_counter()
+        gameState.makeMove(agent_idx, action)
+        stats.successorTime += time.perf_counter() - tic
+        value = self.get_V_minmax_ab(1 - agent_idx, gameState, depth - 1, alpha, beta)
+        tic = time.perf_counter()
+        gameState.undoMove()
+        stats.successorTime += time.perf_counter() - tic
+        return value
+
+    def scoutChild(self, stats, agent_idx, action, gameState, depth, alpha, beta):
+        """
+        searchChild for a child after the first in PVS mode, searched by scout.
+        """
+        if stats is None:
+            gameState.makeMove(agent_idx, action)
+            value = self.scout(agent_idx, gameState, depth - 1, alpha, beta)
+            gameState.undoMove()
+            return value
+        tic = time.perf_counter()
+        gameState.makeMove(agent_idx, action)
+        stats.successorTime += time.perf_counter() - tic
+        value = self.scout(agent_idx, gameState, depth - 1, alpha, beta)
+        tic = time.perf_counter()
+        gameState.undoMove()
+        stats.successorTime += time.perf_counter() - tic
+        return value
+
+    def scout(self, agent_idx, gameState, depth, alpha, beta):
+        """
+        Returns the value of gameState, just reached by a move of agent_idx,
+        searched first with a null window at the moving agent's bound. Only a
+        position that fails high for the mover, so may be better than the
+        bound, is searched again, with the window narrowed by the value the
+        null window search proved.
+        """
+        if agent_idx == 0:
+            (low, high) = (alpha, math.nextafter(alpha, math.inf))
+        else:
+            (low, high) = (math.nextafter(beta, -math.inf), beta)
+        value = self.get_V_minmax_ab(1 - agent_idx, gameState, depth, low, high)
+        if alpha < value < beta:
+            if self.stats is not None:
+                self.stats.researches += 1
+            if agent_idx == 0:
+                (low, high) = (math.nextafter(value, -math.inf), beta)
+            else:
+                (low, high) = (alpha, math.nextafter(value, math.inf))
+            value = self.get_V_minmax_ab(1 - agent_idx, gameState, depth, low, high)
+        return value
+
+# worker side of AlphaBetaAgent.searchRootParallel: each worker process keeps
+# its own serial agent, with its own tables, for the life of the pool
+rootWorkerAgent = None
+rootWorkerBound = None
+
+def initRootWorker(config, bound):
+    global rootWorkerAgent, rootWorkerBound
+    rootWorkerAgent = AlphaBetaAgent(**config)
+    rootWorkerBound = bound
+
+def searchRootMove(state, agentIndex, action, depth, deadline, searchId, window=None):
+    """
+    Searches one root move under the shared bound and tightens the bound when
+    the move ties or beats it. Returns the score, the worker's stats for the
+    move (None if the agent does not collect them) and the line below it.
+    """
+    agent = rootWorkerAgent
+    if agent.searchId != searchId:
+        agent.searchId = searchId
+        agent.transpositionTable.newSearch()
+        agent.moveOrderer.newSearch()
+    agent.deadline = deadline
+    if agent.collectStats:
+        agent.stats = SearchStats()
+    (alpha, beta) = rootWindow(agentIndex, rootWorkerBound.value, window)
+    agent.pvLines = [()] * (depth + 1)
+    state.makeMove(agentIndex, action)
+    score = agent.get_V_minmax_ab(1 - agentIndex, state, depth, alpha, beta)
+    with rootWorkerBound.get_lock():
+        if (score > rootWorkerBound.value) if agentIndex == 0 else (score < rootWorkerBound.value):
+            rootWorkerBound.value = score
+    line = agent.followTable(state, 1 - agentIndex, agent.pvLines[depth], depth)
+    return (score, agent.stats, tuple(line))
+
+def rootWindow(agentIndex, best, window=None):
+    """
+    Returns the (alpha, beta) window for a root move of agentIndex when the
+    best root score so far is best. The window is just wide enough that any
+    move which ties or beats best gets its exact value; an aspiration window
+    (low, high) narrows it.
+    """
+    if agentIndex == 0:
+        (alpha, beta) = (math.nextafter(best, -math.inf), float("inf"))
+    else:
+        (alpha, beta) = (float("-inf"), math.nextafter(best, math.inf))
+    if window is not None:
+        (alpha, beta) = (max(alpha, window[0]), min(beta, window[1]))
+    return (alpha, beta)
+
+class MCTSNode:
+    """
+    A node of the Monte Carlo search tree. agentIndex is the agent whose move
+    led here and value is that agent's total reward over the node's visits.
+    """
+    __slots__ = ('parent', 'action', 'agentIndex', 'children', 'untried', 'visits', 'value')
+
+    def __init__(self, parent, action, agentIndex):
+        self.parent = parent
+        self.action = action
+        self.agentIndex = agentIndex
+        self.children = []
+        self.untried = None # actions not yet expanded, filled on the first visit
+        self.visits = 0
+        self.value = 0.0
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search with UCT selection.
+
+    Every playout walks one private copy of the state with makeMove and
+    undoMove, so no states are allocated per playout. Rollouts play random
+    candidate moves for at most rolloutDepth plies and are scored by the
+    evaluation function squashed to a win probability for player 1.
+
+    The budget is playouts per move, or moveTime seconds if given. With
+    workers > 1 each worker process grows its own tree from the root (root
+    parallelism) and the root visit counts are summed.
+
+    With reuseTree, a serial search keeps the subtree of the move it played.
+    On the next move it continues from the subtree of the opponent's actual
+    reply and drops the rest of the tree. The tree never grows beyond
+    maxNodes nodes; once full, playouts still run but add no nodes.
+    """
+
+    def __init__(self, playouts=2000, moveTime=None, exploration=1.4, rolloutDepth=20, workers=None, seed=None,
+                 reuseTree=True, maxNodes=100000):
+        self.index = 0
+        self.playouts = playouts
+        self.moveTime = moveTime
+        self.exploration = exploration
+        self.rolloutDepth = rolloutDepth
+        self.workers = workers
+        # without a seed, draw one from the global generator so that seeding
+        # the random module makes the whole game reproducible
+        self.random = random.Random(random.getrandbits(64) if seed is None else seed)
+        self.pool = None
+        self.reuseTree = reuseTree
+        self.maxNodes = maxNodes
+        self.tree = None # (node, state) after this agent's last move, kept for reuse
+        self.treeSize = 0
+
+    def getAction(self, gameState):
+        state = gameState.copy() # playouts move this copy in place
+        agentIndex = state.data.turn
+        deadline = None if self.moveTime is None else time.monotonic() + self.moveTime
+        root = None
+        if self.workers is not None and self.workers > 1:
+            visits = self.searchParallel(state, agentIndex, deadline)
+        else:
+            root = self.search(state, agentIndex, self.playouts, deadline, self.reusableRoot(state))
+            visits = {child.action: child.visits for child in root.children}
+        if not visits: # no playout finished; fall back to the first candidate
+            return state.getCandidateActions(agentIndex)[0]
+        action = max(visits, key=visits.get)
+        if self.reuseTree and root is not None:
+            state.makeMove(agentIndex, action)
+            self.tree = (next(child for child in root.children if child.action == action), state)
+        return action
+
+    def reusableRoot(self, state):
+        """
+        Returns the node of the kept tree whose position is state, detached
+        from the rest of the tree, or None if the opponent's reply was never
+        expanded. Either way the rest of the old tree is dropped.
+        """
+        if self.tree is None:
+            return None
+        (node, node_state) = self.tree
+        self.tree = None
+        for child in node.children:
+            node_state.makeMove(child.agentIndex, child.action)
+            reached = node_state == state
+            node_state.undoMove()
+            if reached:
+                child.parent = None
+                return child
+        return None
+
+    def search(self, state, agentIndex, playouts, deadline=None, root=None):
+        """
+        Runs playouts from state, or as many as fit before deadline, and
+        returns the root of the tree. root may be a subtree kept from an
+        earlier search of the same position.
+        """
+        if root is None:
+            root = MCTSNode(None, None, 1 - agentIndex)
+        self.treeSize = countNodes(root)
+        count = 0
+        while (deadline is None and count < playouts) or (deadline is not None and time.monotonic() < deadline):
+            self.playout(root, state)
+            count += 1
+        return root
+
+    def playout(self, root, state):
+        """
+        One selection, expansion, rollout and backpropagation pass. Leaves
+        state as it was.
+        """
+        node = root
+        moves = 0
+        # selection: descend through fully expanded nodes by UCT
+        while node.untried is not None and not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.value / child.visits
+                       + self.exploration * math.sqrt(log_visits / child.visits))
+            state.makeMove(node.agentIndex, node.action)
+            moves += 1
+
+        # expansion: add one untried child
+        if node.untried is None:
+            node.untried = [] if state.isWin() or state.isLose() \
+                else state.getCandidateActions(1 - node.agentIndex)
+            self.random.shuffle(node.untried)
+        if node.untried and self.treeSize < self.maxNodes:
+            child = MCTSNode(node, node.untried.pop(), 1 - node.agentIndex)
+            node.children.append(child)
+            self.treeSize += 1
+            state.makeMove(child.agentIndex, child.action)
+            moves += 1
+            node = child
+
+        # rollout and backpropagation
+        (reward, rollout_moves) = self.rollout(state, 1 - node.agentIndex)
+        moves += rollout_moves
+        while node is not None:
+            node.visits += 1
+            node.value += reward if node.agentIndex == 0 else 1 - reward
+            node = node.parent
+        for i in range(moves):
+            state.undoMove()
+
+    def rollout(self, state, agentIndex):
+        """
+        Plays random candidate moves in place from state. Returns the reward
+        for player 1 in [0, 1] and the number of moves played, which the
+        caller undoes.
+        """
+        moves = 0
+        for ply in range(self.rolloutDepth):
+            if state.isWin() or state.isLose():
+                break
+            candidates = state.data.candidates
+            if not candidates:
+                break
+            idx = self.random.choice(tuple(candidates))
+            state.makeMove(agentIndex, divmod(idx, state.data.board_size))
+            moves += 1
+            agentIndex = 1 - agentIndex
+        return 1 / (1 + math.exp(-betterEvaluationFunction(state) / 50)), moves
+
+    def searchParallel(self, state, agentIndex, deadline):
+        """
+        Runs an independent search per worker and sums the root visit counts.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        config = {'exploration': self.exploration, 'rolloutDepth': self.rolloutDepth}
+        playouts = -(-self.playouts // self.workers)
+        futures = [self.pool.submit(searchMCTSWorker, config, state, agentIndex, playouts, deadline,
+                                    self.random.getrandbits(32)) for i in range(self.workers)]
+        visits = {}
+        for future in futures:
+            for (action, count) in future.result().items():
+                visits[action] = visits.get(action, 0) + count
+        return visits
+
+    def close(self):
+        """
+        Shuts down the worker pool, if one was started.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __getstate__(self):
+        fields = dict(self.__dict__)
+        fields['pool'] = None
+        fields['tree'] = None
+        return fields
+
+def countNodes(root):
+    """
+    Returns the number of nodes in the tree under root, root included.
+    """
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+def searchMCTSWorker(config, state, agentIndex, playouts, deadline, seed):
+    """
+    Worker side of MCTSAgent.searchParallel. Returns the root visit counts.
+    """
+    agent = MCTSAgent(seed=seed, **config)
+    root = agent.search(state, agentIndex, playouts, deadline)
+    return {child.action: child.visits for child in root.children}
+
+# subjective feature weights 
+evaluationWeights = [1, -1, 30, -30, 
+                     2, -2, 3, -3, 4, -4, 
+                     -3, 3, 4, -4, 7, -7, 
+                     4, -4, 20, -20, 100, -100]
+
 def betterEvaluationFunction(currentGameState) -> float:
     """
       Our unstoppable evaluation function
@@ -168,100 +986,48 @@ def betterEvaluationFunction(currentGameState) -> float:
     if currentGameState.isLose():
         return loss_pentalty
     
-    # otherwise, calculate relative reward
-    (all_p1, all_p2, protected_p1, protected_p2, half_protected_p1, \
-     half_protected_p2, unprotected_p1, unprotected_p2) = currentGameState.getRunLengths()
-    
-    # number of protected runs
-    p1_doubles_prot = sum([i == 2 for i in protected_p1])
-    p2_doubles_prot = sum([i == 2 for i in protected_p2]) 
-    p1_triples_prot = sum([i == 3 for i in protected_p1]) 
-    p2_triples_prot = sum([i == 3 for i in protected_p2]) 
-    p1_quadruples_prot = sum([i == 4 for i in protected_p1])
-    p2_quadruples_prot = sum([i == 4 for i in protected_p2])
-
-    # number of unprotected runs
-    p1_doubles_unprot = sum([i == 2 for i in unprotected_p1])
-    p2_doubles_unprot = sum([i == 2 for i in unprotected_p2]) 
-    p1_triples_unprot = sum([i == 3 for i in unprotected_p1]) 
-    p2_triples_unprot = sum([i == 3 for i in unprotected_p2]) 
-    p1_quadruples_unprot = sum([i == 4 for i in unprotected_p1])
-    p2_quadruples_unprot = sum([i == 4 for i in unprotected_p2])
-
-    # number of half-protected runs
-    p1_doubles_half_prot = sum([i == 2 for i in half_protected_p1]) 
-    p2_doubles_half_prot = sum([i == 2 for i in half_protected_p2]) 
-    p1_triples_half_prot = sum([i == 3 for i in half_protected_p1]) 
-    p2_triples_half_prot = sum([i == 3 for i in half_protected_p2]) 
-    p1_quadruples_half_prot = sum([i == 4 for i in half_protected_p1])
-    p2_quadruples_half_prot = sum([i == 4 for i in half_protected_p2])
-
-    # Other features
+    # otherwise, calculate relative reward from the run counts the state keeps
+    # up to date: (protected, half protected, unprotected) x (doubles, triples,
+    # quadruples) x (p1, p2)
     p1_pieces = currentGameState.getNumPieces(0)
     p2_pieces = currentGameState.getNumPieces(1)
     p1_captures = currentGameState.getNumCaptures(0)
     p2_captures = currentGameState.getNumCaptures(1) 
-    
-    num_p1_doubles = sum([i == 2 for i in all_p1]) \
-                        - sum([i == 3 for i in all_p1])
-    num_p2_doubles = sum([i == 2 for i in all_p2]) \
-                        - sum([i == 3 for i in all_p2])
-    num_p1_triples = sum([i == 3 for i in all_p1]) \
-                        - sum([i == 4 for i in all_p1])
-    num_p2_triples = sum([i == 3 for i in all_p2]) \
-                        - sum([i == 4 for i in all_p2])
-    num_p1_quadruples = sum([i == 4 for i in all_p1])
-    num_p2_quadruples = sum([i == 4 for i in all_p2])  
-
-    assert(num_p1_doubles == p1_doubles_prot + p1_doubles_unprot + p1_doubles_half_prot)
-    assert(num_p2_doubles == p2_doubles_prot + p2_doubles_unprot + p2_doubles_half_prot)
-    assert(num_p1_triples == p1_triples_prot + p1_triples_unprot + p1_triples_half_prot)
-    assert(num_p2_triples == p2_triples_prot + p2_triples_unprot + p2_triples_half_prot)
-    assert(num_p1_quadruples == p1_quadruples_prot + p1_quadruples_unprot + p1_quadruples_half_prot)
-    assert(num_p2_quadruples == p2_quadruples_prot + p2_quadruples_unprot + p2_quadruples_half_prot)
-
-    
-    # state_features = [p1_pieces,
-    #                   p2_pieces,
-    #                   p1_captures,
-    #                   p2_captures,
-    #                   p1_doubles,
-    #                   p2_doubles,
-    #                   p1_triples,
-    #                   p2_triples,
-    #                   p1_quadruples,
-    #                   p2_quadruples]
 
     state_features = [p1_pieces,
                       p2_pieces,
                       p1_captures,
-                      p2_captures, 
-
-                      p1_doubles_prot,
-                      p2_doubles_prot,
-                      p1_triples_prot,
-                      p2_triples_prot,
-                      p1_quadruples_prot,
-                      p2_quadruples_prot,
-
-                      p1_doubles_half_prot,
-                      p2_doubles_half_prot,
-                      p1_triples_half_prot,
-                      p2_triples_half_prot,
-                      p1_quadruples_half_prot,
-                      p2_quadruples_half_prot,
-
-                      p1_doubles_unprot,
-                      p2_doubles_unprot,
-                      p1_triples_unprot,
-                      p2_triples_unprot,
-                      p1_quadruples_unprot,
-                      p2_quadruples_unprot]
-
-    # subjective feature weights 
-    weights = [1, -1, 30, -30, 
-               2, -2, 3, -3, 4, -4, 
-               -3, 3, 4, -4, 7, -7, 
-               4, -4, 20, -20, 100, -100]
-    return sum([state_features[i] * weights[i] for i in range(len(state_features))])
+                      p2_captures] + currentGameState.getRunCounts()
+
+    return sum([state_features[i] * evaluationWeights[i] for i in range(len(state_features))])
+
+def vectorizedEvaluationFunction(currentGameState) -> float:
+    """
+      betterEvaluationFunction computed from scratch on a NumPy board array
+      rather than from the state's incremental counts. Returns the same value.
+    """
+    padded = features.boardArray(currentGameState)
+    terminal = features.terminalValue(currentGameState, padded, 1000, -1000)
+    if terminal is not None:
+        return terminal
+    return float(features.stateFeatures(currentGameState, padded) @ evaluationWeights)
 
+def batchEvaluationFunction(gameStates, snapshots=None):
+    """
+      Evaluates many states in one call on stacked board arrays, so siblings
+      share the interpreter overhead. Returns the (N, 22) feature matrix and
+      the N scores, which equal betterEvaluationFunction's. Pass snapshots
+      (features.snapshot) instead of states for states that are moved in place.
+    """
+    if snapshots is None:
+        snapshots = [features.snapshot(state) for state in gameStates]
+    if len(snapshots) == 0:
+        return np.empty((0, 22)), np.empty(0)
+    config = gameStates[0].data
+    padded = features.stackBoards(snapshots, config.board_size, config.run_len_to_win)
+    matrix = features.batchFeatures(snapshots, config.board_size, config.run_len_to_win, padded)
+    scores = matrix @ evaluationWeights
+    terminal = features.batchTerminalValues(snapshots, padded, config.captures_to_win,
+                                            config.run_len_to_win, 1000, -1000)
+    scores = np.where(np.isnan(terminal), scores, terminal)
+    return matrix, scores
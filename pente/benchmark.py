@@ -0,0 +1,255 @@
+# benchmark.py
+# ------------
+"""
+Benchmarks for the rules engine and the search agents.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --baseline bench.json
+
+Every benchmark runs on fixed opening, midgame and dense positions, built by
+seeded random play, so runs on different trees measure the same work. Results
+are written as JSON; given --baseline, each result is compared with the saved
+one and the command exits non-zero if any rate or time regressed by more than
+--tolerance, or if a node count changed.
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+
+from agents import AlphaBetaAgent, MinimaxAgent, betterEvaluationFunction
+from pente import GameState, playerRules
+
+# number of stones on the positions of each set
+POSITION_SETS = {'opening': 4, 'midgame': 16, 'dense': 40} # even, so player 1 is to move
+POSITIONS_PER_SET = 8
+# the search benchmarks use the first few midgame positions only
+SEARCH_POSITIONS = 3
+
+# whether a larger value of the unit is better, for the baseline comparison
+HIGHER_IS_BETTER = {'ops/s': True, 'nodes/s': True, 'leaves/s': True, 's': False}
+
+
+def makePositions(kind, count=POSITIONS_PER_SET, board_size=9):
+    """
+    Returns count non-terminal positions of the given set, each reached by
+    seeded random play of candidate moves.
+    """
+    stones = POSITION_SETS[kind]
+    positions = []
+    attempt = 0
+    while len(positions) < count:
+        rng = random.Random(f"benchmark {kind} {board_size} {attempt}")
+        attempt += 1
+        state = GameState(board_size)
+        for ply in range(stones):
+            state = state.generateSuccessor(ply % 2, rng.choice(state.getCandidateActions(ply % 2)))
+            if state.isWin() or state.isLose():
+                break
+        else:
+            positions.append(state)
+    return positions
+
+
+def measure(fn, minTime, repeat=3):
+    """
+    Returns the fastest calls of fn per second over repeat rounds, each of
+    which calls fn until minTime seconds have passed. Taking the fastest round,
+    as timeit does, keeps noise from other processes out of the result.
+    """
+    best = 0.0
+    for _ in range(repeat):
+        calls = 0
+        tic = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < minTime or calls == 0:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - tic
+        best = max(best, calls / elapsed)
+    return best
+
+
+def rulesBenchmarks(positions, minTime):
+    """
+    Yields (name, value, unit) for the rules engine operations on each
+    position set, in ops per second. One op is one call on one position.
+    """
+    for (kind, states) in positions.items():
+        moves = [(state, state.getCandidateActions(0)) for state in states]
+
+        def successors():
+            for (state, actions) in moves:
+                for action in actions:
+                    state.generateSuccessor(0, action)
+
+        def captures():
+            for (state, actions) in moves:
+                for action in actions:
+                    playerRules.is_capture(state, action, 0)
+
+        def terminal():
+            for state in states:
+                state.isWin()
+                state.isLose()
+
+        per_move = sum(len(actions) for (state, actions) in moves)
+        cases = [
+            ('generateSuccessor', successors, per_move),
+            ('getLegalActions', lambda: [state.getLegalActions(0) for state in states], len(states)),
+            ('getRunLengths', lambda: [state.getRunLengths() for state in states], len(states)),
+            ('is_capture', captures, per_move),
+            ('isWin/isLose', terminal, len(states)),
+            ('betterEvaluationFunction', lambda: [betterEvaluationFunction(state) for state in states], len(states)),
+        ]
+        for (name, fn, ops) in cases:
+            yield (f"rules/{name}/{kind}", measure(fn, minTime) * ops, 'ops/s')
+
+
+def countingEvaluation(counter):
+    def evaluate(gameState):
+        counter[0] += 1
+        return betterEvaluationFunction(gameState)
+    return evaluate
+
+
+def searchBenchmarks(positions, maxDepth, minimaxDepth, minTime):
+    """
+    Yields (name, value, unit) for the search agents: the time to search the
+    first midgame positions to each depth, with fresh agents, and the rate of
+    work. AlphaBetaAgent's work is the nodes its SearchStats count;
+    MinimaxAgent keeps no stats, so its work is the evaluated leaves. The
+    counts come from a separate run, as the search does not depend on them,
+    so collecting stats does not slow the timed runs. Times are the fastest
+    of measure's rounds.
+    """
+    states = positions['midgame'][:SEARCH_POSITIONS]
+    for depth in range(minimaxDepth + 1):
+        counter = [0]
+        for state in states:
+            agent = MinimaxAgent(depth=depth)
+            agent.evaluationFunction = countingEvaluation(counter)
+            agent.getAction(state)
+        rate = measure(lambda: [MinimaxAgent(depth=depth).getAction(state) for state in states], minTime)
+        yield (f"search/MinimaxAgent/depth{depth}/time", 1 / rate, 's')
+        yield (f"search/MinimaxAgent/depth{depth}/leaves", counter[0] * rate, 'leaves/s')
+    for depth in range(maxDepth + 1):
+        nodes = 0
+        for state in states:
+            agent = AlphaBetaAgent(depth=depth, progress=False, collectStats=True)
+            agent.getAction(state)
+            nodes += agent.stats.nodes
+        rate = measure(lambda: [AlphaBetaAgent(depth=depth, progress=False).getAction(state) for state in states],
+                       minTime)
+        yield (f"search/AlphaBetaAgent/depth{depth}/time", 1 / rate, 's')
+        yield (f"search/AlphaBetaAgent/depth{depth}/nodes", nodes * rate, 'nodes/s')
+
+
+def perft(state, agentIndex, depth):
+    """
+    Counts the leaf nodes of the candidate move tree to depth, perft style.
+    Terminal positions are leaves.
+    """
+    if depth == 0 or state.isWin() or state.isLose():
+        return 1
+    nodes = 0
+    for action in playerRules.getCandidateActions(state, agentIndex):
+        state.makeMove(agentIndex, action)
+        nodes += perft(state, 1 - agentIndex, depth - 1)
+        state.undoMove()
+    return nodes
+
+
+def perftBenchmarks(positions, maxDepth, minTime):
+    """
+    Yields (name, value, unit) for perft on the first position of each set:
+    the leaf count, which must never change, and the nodes per second.
+    """
+    for (kind, states) in positions.items():
+        state = states[0].copy()
+        for depth in range(1, maxDepth + 1):
+            nodes = perft(state, 0, depth)
+            yield (f"perft/{kind}/depth{depth}/count", nodes, 'nodes')
+            yield (f"perft/{kind}/depth{depth}/rate", measure(lambda: perft(state, 0, depth), minTime) * nodes,
+                   'nodes/s')
+
+
+def runBenchmarks(minTime=0.2, searchDepth=2, perftDepth=2, board_size=9, minimaxDepth=1):
+    """
+    Runs every benchmark and returns the results document.
+    """
+    positions = {kind: makePositions(kind, board_size=board_size) for kind in POSITION_SETS}
+    results = {}
+    for (name, value, unit) in rulesBenchmarks(positions, minTime):
+        results[name] = {'value': value, 'unit': unit}
+    for (name, value, unit) in searchBenchmarks(positions, searchDepth, minimaxDepth, minTime):
+        results[name] = {'value': value, 'unit': unit}
+    for (name, value, unit) in perftBenchmarks(positions, perftDepth, minTime):
+        results[name] = {'value': value, 'unit': unit}
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'board_size': board_size,
+            'min_time': minTime,
+            'search_depth': searchDepth,
+            'minimax_depth': minimaxDepth,
+            'perft_depth': perftDepth,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Returns the lines describing results that regressed against the baseline.
+    Node counts must match exactly; rates and times may move by tolerance.
+    """
+    regressions = []
+    for (name, old) in baseline['results'].items():
+        new = current['results'].get(name)
+        if new is None:
+            continue
+        if old['unit'] == 'nodes':
+            if new['value'] != old['value']:
+                regressions.append(f"{name}: node count {old['value']} -> {new['value']}")
+            continue
+        ratio = new['value'] / old['value'] if old['value'] else math.inf
+        if not HIGHER_IS_BETTER[old['unit']]:
+            ratio = 1 / ratio if ratio else math.inf
+        if ratio < 1 - tolerance:
+            regressions.append(f"{name}: {old['value']:.6g} -> {new['value']:.6g} {old['unit']} "
+                               f"({(ratio - 1) * 100:+.1f}%)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default='-', help='JSON output file (default: stdout)')
+    parser.add_argument('--baseline', help='saved results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown, as a fraction')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to time each benchmark round')
+    parser.add_argument('--search-depth', type=int, default=2, help='deepest AlphaBetaAgent search')
+    parser.add_argument('--minimax-depth', type=int, default=1,
+                        help='deepest MinimaxAgent search; full width, so kept shallow')
+    parser.add_argument('--perft-depth', type=int, default=2)
+    parser.add_argument('--board-size', type=int, default=9)
+    args = parser.parse_args()
+
+    current = runBenchmarks(args.min_time, args.search_depth, args.perft_depth, args.board_size, args.minimax_depth)
+    if args.out == '-':
+        json.dump(current, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.out, 'w') as out:
+            json.dump(current, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(current, json.load(baseline), args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
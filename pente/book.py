@@ -0,0 +1,156 @@
+# book.py
+# -------
+"""
+Opening book: the move to play in positions from the first plies of a game.
+
+A book file is a small header followed by fixed-size records sorted by
+position key, so a lookup is a binary search over the memory-mapped file and
+loading it parses nothing but the header. Keys are symmetry-canonical
+(GameState.getCanonicalHash) and moves are stored in the canonical image of
+the position, so one record serves all eight symmetric positions.
+
+    python book.py --games 200 --plies 8 --depth 2 --out book.bin
+
+builds a book from self-play of AlphaBetaAgent; agents use it with
+AlphaBetaAgent(book='book.bin').
+"""
+
+import argparse
+import mmap
+import random
+import struct
+from collections import Counter, defaultdict
+
+from tables import symmetries, INVERSE_SYMMETRY
+
+MAGIC = b'PBK2'
+# magic, board_size, captures_to_win, run_len_to_win, number of records
+HEADER = struct.Struct('<4sHHHI')
+# canonical position key, canonical move cell index, times the move was chosen
+RECORD = struct.Struct('<QHH')
+
+
+class OpeningBook:
+    """
+    A read-only opening book backed by a memory-mapped book file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.board_size, self.captures_to_win, self.run_len_to_win, self.count) = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or len(self.map) != HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not an opening book")
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        return RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+
+    def find(self, key):
+        """
+        Returns the (key, cell index, count) record of key, or None.
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self.record(mid)
+            if record[0] < key:
+                lo = mid + 1
+            elif record[0] > key:
+                hi = mid
+            else:
+                return record
+        return None
+
+    def lookup(self, gameState):
+        """
+        Returns the book move for gameState, or None if the position is not
+        in the book or the book was built for other rules.
+        """
+        data = gameState.data
+        if (data.board_size, data.captures_to_win, data.run_len_to_win) != \
+                (self.board_size, self.captures_to_win, self.run_len_to_win):
+            return None
+        (key, symmetry) = gameState.getCanonicalHash()
+        record = self.find(key)
+        if record is None:
+            return None
+        idx = symmetries(data.board_size)[INVERSE_SYMMETRY[symmetry]][record[1]]
+        if data.board[idx] != 0:
+            return None
+        return divmod(idx, data.board_size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, fields):
+        self.__init__(fields['path'])
+
+
+def writeBook(path, moves, board_size, captures_to_win, run_len_to_win):
+    """
+    Writes a book file from moves, a dict of canonical position key to Counter
+    of the canonical cell indices played there. Each position keeps its most
+    played move.
+    """
+    records = []
+    for (key, counts) in moves.items():
+        (idx, count) = max(counts.items(), key=lambda item: (item[1], -item[0]))
+        records.append((key, idx, min(count, 0xFFFF)))
+    records.sort()
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, board_size, captures_to_win, run_len_to_win, len(records)))
+        out.write(b''.join(RECORD.pack(*record) for record in records))
+
+
+def selfPlayMoves(games, plies, depth, board_size=9, captures_to_win=5, run_len_to_win=5, seed=0):
+    """
+    Plays games self-play games of AlphaBetaAgent for their first plies moves
+    and returns, per canonical position key, a Counter of the chosen cells,
+    mapped into the canonical image. The agent breaks ties at random, so
+    seeded games still differ.
+    """
+    from agents import AlphaBetaAgent
+    from pente import GameState
+
+    random.seed(seed)
+    agent = AlphaBetaAgent('betterEvaluationFunction', depth=depth, progress=False)
+    moves = defaultdict(Counter)
+    for game in range(games):
+        state = GameState(board_size, captures_to_win, run_len_to_win)
+        for ply in range(plies):
+            if state.isWin() or state.isLose():
+                break
+            state.setTurn(ply % 2)
+            action = agent.getAction(state)
+            (key, symmetry) = state.getCanonicalHash()
+            moves[key][symmetries(board_size)[symmetry][action[0] * board_size + action[1]]] += 1
+            state = state.generateSuccessor(ply % 2, action)
+    return moves
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an opening book from self-play.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--plies', type=int, default=8, help='moves per game to record')
+    parser.add_argument('--depth', type=int, default=2, help='AlphaBetaAgent search depth')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board-size', type=int, default=9)
+    parser.add_argument('--captures-to-win', type=int, default=5)
+    parser.add_argument('--run-len-to-win', type=int, default=5)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    moves = selfPlayMoves(args.games, args.plies, args.depth, args.board_size, args.captures_to_win,
+                          args.run_len_to_win, args.seed)
+    writeBook(args.out, moves, args.board_size, args.captures_to_win, args.run_len_to_win)
+    print(f"{len(moves)} positions written to {args.out}")
@@ -0,0 +1,62 @@
+# cache.py
+# --------------
+# A bounded memo of evaluation results for the search agents.
+
+from collections import OrderedDict
+
+class EvaluationCache:
+    """
+    Wraps an evaluation function with a least-recently-used memo keyed by the
+    position's zobrist key (GameState.getHash), which covers the board, the
+    captures and the agent to move: everything the evaluation reads.
+
+    At most maxEntries results are kept; the least recently used is evicted
+    first. hits, misses and evictions count the lookups. The cache is called
+    like the function it wraps, so it can stand in for an agent's
+    evaluationFunction.
+    """
+
+    def __init__(self, evaluationFunction, maxEntries=2**16):
+        assert(maxEntries > 0)
+        self.evaluationFunction = evaluationFunction
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, gameState):
+        key = gameState.getHash()
+        entries = self.entries
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.evaluationFunction(gameState)
+        entries[key] = value
+        if len(entries) > self.maxEntries:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        """
+        Pickles the configuration only, so each worker process starts its own
+        empty cache.
+        """
+        return {'evaluationFunction': self.evaluationFunction, 'maxEntries': self.maxEntries}
+
+    def __setstate__(self, fields):
+        self.__init__(fields['evaluationFunction'], fields['maxEntries'])
@@ -0,0 +1,173 @@
+# features.py
+# --------------
+# NumPy versions of the board scans behind betterEvaluationFunction. Runs and
+# their ends are found for every cell at once by comparing shifted views of a
+# padded board array, instead of walking each stone in Python.
+
+import numpy as np
+
+WALL = 3 # padding value marking cells off the board
+PADDING = 5 # enough for a run of 4 plus the cells at both of its ends
+DIRECTIONS = ((1, 0), (1, 1), (0, 1), (-1, 1))
+
+def paddingFor(run_len_to_win):
+    """
+    Returns the padding a board needs so that runs of up to run_len_to_win
+    can be read off shifted views.
+    """
+    return max(PADDING, run_len_to_win)
+
+def boardArray(state):
+    """
+    Returns the board as a (size + 2 * padding) square int8 array of player
+    index + 1 (0 for empty) surrounded by WALL, with padding from paddingFor.
+    """
+    return paddedBoard(state.data.board, state.data.board_size, state.data.run_len_to_win)
+
+def paddedBoard(board, board_size, run_len_to_win):
+    """
+    boardArray for a flat board given as bytes or a bytearray.
+    """
+    padding = paddingFor(run_len_to_win)
+    padded = np.full((board_size + 2 * padding, board_size + 2 * padding), WALL, dtype=np.int8)
+    padded[padding:padding + board_size, padding:padding + board_size] = \
+        np.frombuffer(bytes(board), dtype=np.int8).reshape(board_size, board_size)
+    return padded
+
+def shiftedViews(padded, offsets, padding=PADDING):
+    """
+    Returns {k: views} where views[d, x, y] is the cell k steps from (x, y) in
+    direction DIRECTIONS[d]. The leading axes of padded (if any) are kept, so a
+    stack of boards gives views of shape (..., 4, size, size).
+    """
+    size = padded.shape[-1] - 2 * padding
+    views = {}
+    for k in offsets:
+        views[k] = np.stack([padded[..., padding + k * dx:padding + k * dx + size,
+                                    padding + k * dy:padding + k * dy + size]
+                             for (dx, dy) in DIRECTIONS], axis=-3)
+    return views
+
+def runCounts(padded, padding=PADDING):
+    """
+    Returns the counts of maximal runs of length 2, 3 and 4, in the order of
+    GameState.getRunCounts, classified exactly as getRunLengths does. padded
+    may be a single board array or a stack of them; counts are per board.
+    """
+    views = shiftedViews(padded, range(-1, 5), padding)
+    counts = np.zeros(padded.shape[:-2] + (18,), dtype=np.int64)
+    prev = views[-1]
+    prev_in = prev != WALL
+    for player in (1, 2):
+        opponent = 3 - player
+        is_player = {k: views[k] == player for k in range(0, 5)}
+        prev_opp = prev == opponent
+        run = is_player[0] & ~(prev == player) # cells starting a run
+        for run_length in (2, 3, 4):
+            run = run & is_player[run_length - 1]
+            nxt = views[run_length]
+            exact = run & ~is_player[run_length]
+            next_in = nxt != WALL
+            next_opp = nxt == opponent
+            both_in = prev_in & next_in
+            only_prev = prev_in & ~next_in
+            only_next = ~prev_in & next_in
+            end_opp = (only_prev & prev_opp) | (only_next & next_opp)
+            one_end = only_prev | only_next
+            protected = (both_in & prev_opp & next_opp) | end_opp | (~prev_in & ~next_in)
+            half = (both_in & (prev_opp ^ next_opp)) | (one_end & ~end_opp & (run_length > 2))
+            unprotected = (both_in & ~prev_opp & ~next_opp) | (one_end & ~end_opp & (run_length == 2))
+            for (protection, cells) in enumerate((protected, half, unprotected)):
+                counts[..., protection * 6 + (run_length - 2) * 2 + player - 1] = \
+                    (exact & cells).sum(axis=(-3, -2, -1))
+    return counts
+
+def hasRun(padded, player, run_len, padding=PADDING):
+    """
+    Returns whether player has a run of at least run_len, per board.
+    """
+    views = shiftedViews(padded, range(run_len), padding)
+    run = views[0] == player
+    for k in range(1, run_len):
+        run = run & (views[k] == player)
+    return run.any(axis=(-3, -2, -1))
+
+def stateFeatures(state, padded=None):
+    """
+    Returns the 22 features of betterEvaluationFunction as an array: pieces
+    and captures per player followed by the run counts.
+    """
+    if padded is None:
+        padded = boardArray(state)
+    features = np.empty(22, dtype=np.float64)
+    features[0] = state.getNumPieces(0)
+    features[1] = state.getNumPieces(1)
+    features[2] = state.getNumCaptures(0)
+    features[3] = state.getNumCaptures(1)
+    features[4:] = runCounts(padded, paddingFor(state.data.run_len_to_win))
+    return features
+
+def terminalValue(state, padded, win_reward, loss_penalty):
+    """
+    Mirrors the isWin/isLose checks of betterEvaluationFunction on the board
+    array. Returns the reward, or None for a non-terminal state.
+    """
+    data = state.data
+    padding = paddingFor(data.run_len_to_win)
+    if data.num_player_1_captures >= data.captures_to_win or hasRun(padded, 1, data.run_len_to_win, padding) \
+        or (data.turn == 1 and len(data.stones) == len(data.board)):
+        return win_reward
+    if data.num_player_2_captures >= data.captures_to_win or hasRun(padded, 2, data.run_len_to_win, padding) \
+        or (data.turn == 0 and len(data.stones) == len(data.board)):
+        return loss_penalty
+    return None
+
+def snapshot(state):
+    """
+    Returns the parts of a state the evaluation reads, as a small tuple that
+    stays valid after the state is moved in place: (board bytes, pieces per
+    player, captures per player, turn, number of empty cells).
+    """
+    data = state.data
+    return (bytes(data.board), data.num_pieces[0], data.num_pieces[1],
+            data.num_player_1_captures, data.num_player_2_captures, data.turn, len(data.board) - len(data.stones))
+
+def stackBoards(snapshots, board_size, run_len_to_win):
+    """
+    Returns the boards of many snapshots as one (N, size + 2 * padding,
+    size + 2 * padding) padded array, with padding from paddingFor.
+    """
+    padding = paddingFor(run_len_to_win)
+    boards = np.frombuffer(b"".join(snap[0] for snap in snapshots), dtype=np.int8)
+    padded = np.full((len(snapshots), board_size + 2 * padding, board_size + 2 * padding), WALL, dtype=np.int8)
+    padded[:, padding:padding + board_size, padding:padding + board_size] = \
+        boards.reshape(len(snapshots), board_size, board_size)
+    return padded
+
+def batchFeatures(snapshots, board_size, run_len_to_win, padded=None):
+    """
+    Returns the (N, 22) feature matrix of stateFeatures for many snapshots.
+    """
+    if padded is None:
+        padded = stackBoards(snapshots, board_size, run_len_to_win)
+    matrix = np.empty((len(snapshots), 22), dtype=np.float64)
+    matrix[:, :4] = [snap[1:5] for snap in snapshots]
+    matrix[:, 4:] = runCounts(padded, paddingFor(run_len_to_win))
+    return matrix
+
+def batchTerminalValues(snapshots, padded, captures_to_win, run_len_to_win, win_reward, loss_penalty):
+    """
+    terminalValue for many snapshots. Returns an array holding the reward of
+    terminal states and NaN for the others.
+    """
+    scalars = np.array([snap[1:] for snap in snapshots], dtype=np.float64).reshape(len(snapshots), 6)
+    (captures_1, captures_2, turn, num_empty) = scalars[:, 2], scalars[:, 3], scalars[:, 4], scalars[:, 5]
+    padding = paddingFor(run_len_to_win)
+    win = (captures_1 >= captures_to_win) | hasRun(padded, 1, run_len_to_win, padding) \
+        | ((turn == 1) & (num_empty == 0))
+    lose = (captures_2 >= captures_to_win) | hasRun(padded, 2, run_len_to_win, padding) \
+        | ((turn == 0) & (num_empty == 0))
+    values = np.full(len(snapshots), np.nan)
+    values[lose] = loss_penalty
+    values[win] = win_reward # checked first by betterEvaluationFunction
+    return values
@@ -1,4 +1,6 @@
+import time
 
+from tables import zobristKeys, symmetryKeys
 
 class Agent:
   """
@@ -14,49 +16,109 @@ class Agent:
     """
     raiseNotDefined()
 
+# board cells hold the occupying player index + 1, or EMPTY
+EMPTY = 0
+
 class GameStateData:
+  __slots__ = ('board', 'board_size', 'captures_to_win', 'run_len_to_win', 'candidate_radius', 'score',
+               'num_player_1_captures', 'num_player_2_captures', 'num_pieces', 'run_counts',
+               'winning_runs', 'turn', 'hash', 'zobrist', 'symmetry_hashes', 'symmetry_keys', 'stones',
+               'candidates', 'influence')
 
-  def __init__(self, board_size, captures_to_win, run_len_to_win, prevStateData=None):
+  def __init__(self, board_size, captures_to_win, run_len_to_win, prevStateData=None, candidate_radius=2):
     """
     Generates a new data packet by copying information from its predecessor.
+
+    The board is a flat bytearray indexed by x * board_size + y, so copying a
+    state is a single buffer copy.
     """
-    self.board = {}
+    if prevStateData != None:
+        for field in GameStateData.__slots__:
+            setattr(self, field, getattr(prevStateData, field))
+        return
+
+    self.board = bytearray(board_size * board_size)
     self.board_size = board_size
     self.captures_to_win = captures_to_win
     self.run_len_to_win = run_len_to_win
+    self.candidate_radius = candidate_radius
     self.score = 0
     self.num_player_1_captures = 0
     self.num_player_2_captures = 0
+    self.num_pieces = [0, 0]
+    # counts of maximal runs of length 2, 3 and 4, ordered as the run features
+    # of betterEvaluationFunction: (protected, half protected, unprotected)
+    # x (doubles, triples, quadruples) x (player 1, player 2)
+    self.run_counts = [0] * 18
+    # number of maximal runs of at least run_len_to_win per player, so the win
+    # test never scans the board
+    self.winning_runs = [0, 0]
     self.turn = 0 # begin with player 1 turn
+    # zobrist hash of the board cells, and the shared key tables it is built from
+    self.hash = 0
+    self.zobrist = zobristKeys(board_size, captures_to_win)
+    # the board hash of each of the eight symmetric images of the position,
+    # identity first, and the shared key tables they are built from
+    self.symmetry_hashes = (0,) * 8
+    self.symmetry_keys = symmetryKeys(board_size, captures_to_win)
+    # move index: the occupied cells, the empty cells within candidate_radius
+    # of a stone, and per cell the number of stones within candidate_radius of
+    # it. The sets grow with the stones and their surroundings, not the board
+    # area, so large boards copy as cheaply as small ones.
+    self.stones = set()
+    self.candidates = set()
+    self.influence = bytearray(board_size * board_size)
+
+  def __getstate__(self):
+    """
+    Pickles every field but the shared zobrist tables, which are rebuilt from
+    the cache on load, so states are cheap to send to worker processes.
+    """
+    return {field: getattr(self, field) for field in GameStateData.__slots__
+            if field not in ('zobrist', 'symmetry_keys')}
 
-    if prevStateData != None:
-        self.board_size = prevStateData.board_size
-        self.board = prevStateData.board
-        self.captures_to_win = prevStateData.captures_to_win
-        self.run_len_to_win = prevStateData.run_len_to_win
-        self.score = prevStateData.score
-        self.num_player_1_captures = prevStateData.num_player_1_captures
-        self.num_player_2_captures = prevStateData.num_player_2_captures
-        self.turn = prevStateData.turn
+  def __setstate__(self, fields):
+    for (field, value) in fields.items():
+        setattr(self, field, value)
+    self.zobrist = zobristKeys(self.board_size, self.captures_to_win)
+    self.symmetry_keys = symmetryKeys(self.board_size, self.captures_to_win)
+
+  def copy(self):
+    """
+    Returns an independent copy of this data packet.
+    """
+    data = GameStateData(self.board_size, self.captures_to_win, self.run_len_to_win, prevStateData=self)
+    data.board = self.board[:]
+    data.num_pieces = self.num_pieces[:]
+    data.run_counts = self.run_counts[:]
+    data.winning_runs = self.winning_runs[:]
+    data.stones = self.stones.copy()
+    data.candidates = self.candidates.copy()
+    data.influence = self.influence[:]
+    return data
 
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__(self, state, agents, first_turn=0):
+    def __init__(self, state, agents, first_turn=0, verbose=True):
         self.first_turn = first_turn
         self.gameOver = False
         self.moveHistory = []
+        self.moveTimes = []
+        self.winner = None
         self.startingIndex = 0
         self.agents = agents
         self.state = state        
+        # a headless game prints nothing and raises on an invalid move
+        self.verbose = verbose
 
     def __str__(self):
        
-        board_grid = [[0 for i in range(self.state.data.board_size)] for j in range(self.state.data.board_size)]
-        for (location, val) in self.state.data.board.items():
-            board_grid[location[0]][location[1]] = val
+        size = self.state.data.board_size
+        board = self.state.data.board
+        board_grid = [[board[i * size + j] for j in range(size)] for i in range(size)]
             
         board_str = " _ "
         for i in range(self.state.data.board_size):
@@ -91,7 +153,7 @@ class Game:
         print_board = True
 
         while not self.gameOver:
-            if print_board:
+            if print_board and self.verbose:
                 print(self)  
                 print(f"Number of player 1 captures: {self.state.data.num_player_1_captures}")              
                 print(f"Number of player 2 captures: {self.state.data.num_player_2_captures}")              
@@ -99,7 +161,9 @@ class Game:
 
             self.state.setTurn(agentIndex)
             agent = self.agents[agentIndex]
+            tic = time.perf_counter()
             action = agent.getAction(self.state)
+            self.moveTimes.append(time.perf_counter() - tic)
             self.moveHistory.append((agentIndex, action))
             try:
                 if agentIndex == 0:
@@ -111,15 +175,21 @@ class Game:
                     agentIndex = 0
                     print_board = True
             except:
+                if not self.verbose:
+                    raise
                 print("invalid move\n")
                 print_board = False
                 continue
 
             if self.state.isWin():
-                print("You win!!\n")
+                if self.verbose:
+                    print("You win!!\n")
+                self.winner = 0
                 self.gameOver = True
-            if self.state.isLose():
-                print("You loose :(\n")
+            elif self.state.isLose():
+                if self.verbose:
+                    print("You loose :(\n")
+                self.winner = 1
                 self.gameOver = True
 
 
@@ -1,10 +1,10 @@
 
-from game import GameStateData
+from game import GameStateData, EMPTY
 from game import Game
 from agents import cliAgent, randomAgent, AlphaBetaAgent, MinimaxAgent
 import sys, types, time, random, os, cmd
-import copy
 from agents import betterEvaluationFunction
+from tables import neighbourhoods, lines, captureRays
 
 class GameState:
     """
@@ -14,7 +14,7 @@ class GameState:
     can be used by agents to reason about the game.
     """
 
-    def __init__(self, board_size=9, captures_to_win=5, run_len_to_win=5, prevStateData=None):
+    def __init__(self, board_size=9, captures_to_win=5, run_len_to_win=5, prevStateData=None, candidate_radius=2):
 
         if prevStateData is not None: # Initial state
             self.data = GameStateData(board_size=board_size, 
@@ -23,8 +23,10 @@ class GameState:
         else:
             self.data = GameStateData(board_size=board_size, 
                                       captures_to_win=captures_to_win, 
-                                      run_len_to_win=run_len_to_win)
-            
+                                      run_len_to_win=run_len_to_win,
+                                      candidate_radius=candidate_radius)
+        self.undoStack = []
+
     def setTurn(self, agentIndex):
         self.data.turn = agentIndex
 
@@ -36,6 +38,15 @@ class GameState:
 
         return playerRules.getLegalActions(self, agentIndex)
 
+    def getCandidateActions(self, agentIndex=0):
+        """
+        Returns the legal actions worth searching: the empty cells within
+        candidate_radius of a stone. Search agents use these for both agents.
+        """
+        if self.isWin() or self.isLose(): return []
+
+        return playerRules.getCandidateActions(self, agentIndex)
+
     def generateSuccessor(self, agentIndex, action):
         """
         Returns the successor state after the specified agent takes the action.
@@ -44,24 +55,40 @@ class GameState:
         if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
 
         # Copy current state
-        state = GameState(board_size=self.data.board_size, 
-                          run_len_to_win=self.data.run_len_to_win,
-                          captures_to_win=self.data.captures_to_win,
-                          prevStateData=self.deepCopyData())
-        
+        state = self.copy()
+
         # Let agent's logic deal with its action's effects on the board
         playerRules.applyAction(state, action, agentIndex)
         return state
 
+    def makeMove(self, agentIndex, action):
+        """
+        Applies the action to this state in place. The change can be reverted
+        with undoMove, which lets search agents walk the game tree without
+        allocating a state per node.
+        """
+        self.undoStack.append(playerRules.applyAction(self, action, agentIndex))
+
+    def undoMove(self):
+        """
+        Reverts the most recent makeMove.
+        """
+        playerRules.undoAction(self, self.undoStack.pop())
+
+    def copy(self):
+        """
+        Returns an independent copy of this state with an empty undo stack.
+        """
+        return GameState(board_size=self.data.board_size,
+                         run_len_to_win=self.data.run_len_to_win,
+                         captures_to_win=self.data.captures_to_win,
+                         prevStateData=self.deepCopyData())
+
     def getScore(self):
         return self.data.score
 
     def getNumPieces(self, agentIndex):
-        total = 0
-        for (loc, val) in self.data.board.items():
-            if val == agentIndex + 1:
-                total += 1
-        return total 
+        return self.data.num_pieces[agentIndex]
     
     def getNumCaptures(self, agentIndex):
         if agentIndex == 0:
@@ -69,14 +96,132 @@ class GameState:
         else:
             return self.data.num_player_2_captures
 
+    def getCapturesAt(self, action, agentIndex):
+        """
+        Returns the stones the agent would capture by playing the empty cell action.
+        """
+        return playerRules.is_capture(self, action, agentIndex)
+
+    def getRunLengthThrough(self, action, agentIndex):
+        """
+        Returns the longest run the agent would make by playing the empty cell action.
+        """
+        return playerRules.runLengthThrough(self, action, agentIndex)
+
     def getBoard(self):
         return self.data.board
     
     def getBoardPosition(self, x, y):
         assert(x < self.data.board_size and x >= 0)
         assert(y < self.data.board_size and y >= 0)
-        return self.data.board[(x, y)]
+        return self.data.board[x * self.data.board_size + y]
     
+    def setBoardPosition(self, x, y, val):
+        """
+        Writes val (player index + 1, or EMPTY) at (x, y) and keeps the run
+        counts, the hash and the move index in step with the board.
+        """
+        idx = x * self.data.board_size + y
+        cell_keys = self.data.zobrist[0]
+        self.updateRunCounts(x, y, -1)
+        self.data.hash ^= cell_keys[self.data.board[idx]][idx] ^ cell_keys[val][idx]
+        old = self.data.board[idx]
+        self.data.symmetry_hashes = tuple(board_hash ^ keys[old][idx] ^ keys[val][idx] for (board_hash, keys)
+                                          in zip(self.data.symmetry_hashes, self.data.symmetry_keys))
+        self.data.board[idx] = val
+        self.updateMoveIndex(idx, val)
+        self.updateRunCounts(x, y, 1)
+
+    def updateMoveIndex(self, idx, val):
+        """
+        Updates the occupied-cell set and the candidate frontier after the cell
+        at idx was set to val. Only the cells within candidate_radius change.
+        """
+        data = self.data
+        influence = data.influence
+        candidates = data.candidates
+        board = data.board
+        if val == EMPTY:
+            data.stones.discard(idx)
+            for i in neighbourhoods(data.board_size, data.candidate_radius)[idx]:
+                influence[i] -= 1
+                if influence[i] == 0:
+                    candidates.discard(i)
+            if influence[idx] > 0:
+                candidates.add(idx)
+        else:
+            data.stones.add(idx)
+            candidates.discard(idx)
+            for i in neighbourhoods(data.board_size, data.candidate_radius)[idx]:
+                influence[i] += 1
+                if influence[i] == 1 and board[i] == EMPTY:
+                    candidates.add(i)
+
+    def getRunCounts(self):
+        """
+        Returns the counts of maximal runs of length 2, 3 and 4 per player,
+        split by protection, in the order betterEvaluationFunction uses them.
+        These are the same runs getRunLengths classifies, kept up to date on
+        every move instead of rescanning the board.
+        """
+        return self.data.run_counts
+
+    def updateRunCounts(self, x, y, sign):
+        """
+        Adds sign times the contribution of every run that contains or borders
+        (x, y) to the run counts and to the counts of winning runs. Called with
+        -1 before and 1 after the cell changes, so only the four lines through
+        the cell are rescanned.
+        """
+        data = self.data
+        board = data.board
+        counts = data.run_counts
+        run_len_to_win = data.run_len_to_win
+        for (line, position) in lines(data.board_size)[x * data.board_size + y]:
+            end = len(line)
+            prev_player = 0
+            for k in (position - 1, position, position + 1):
+                if k < 0 or k >= end:
+                    prev_player = 0
+                    continue
+                player = board[line[k]]
+                if player == 0 or player == prev_player: # empty, or same run as the last cell
+                    prev_player = player
+                    continue
+                prev_player = player
+
+                # find the ends of the run: line[start:stop]
+                start = k
+                while start > 0 and board[line[start - 1]] == player:
+                    start -= 1
+                stop = k + 1
+                while stop < end and board[line[stop]] == player:
+                    stop += 1
+                run_length = stop - start
+                if run_length >= run_len_to_win:
+                    data.winning_runs[player - 1] += sign
+                if run_length < 2 or run_length > 4:
+                    continue
+
+                # classify the run's ends the same way getRunLengths does
+                opponent = 3 - player
+                prev_in = start > 0
+                next_in = stop < end
+                if prev_in and next_in:
+                    blocked = (board[line[start - 1]] == opponent) + (board[line[stop]] == opponent)
+                    protection = 2 - blocked # unprotected, half protected, protected
+                elif prev_in or next_in:
+                    end_val = board[line[start - 1]] if prev_in else board[line[stop]]
+                    if end_val == opponent:
+                        protection = 0
+                    elif run_length > 2:
+                        protection = 1
+                    else:
+                        protection = 2
+                else:
+                    protection = 0
+                counts[protection * 6 + (run_length - 2) * 2 + player - 1] += sign
+
     def getRunLengths(self):
 
         directions = [(1, 0), (1, 1), (0, 1), (-1, 1)]
@@ -89,7 +234,10 @@ class GameState:
         all_p1 = []
         all_p2 = []
 
-        for (loc, start) in self.data.board.items():
+        size = self.data.board_size
+        for idx in sorted(self.data.stones): # only stones start runs
+            start = self.data.board[idx]
+            loc = divmod(idx, size)
             if start == 1: 
                 for direction in directions:
                     run_length = 0
@@ -207,63 +355,74 @@ class GameState:
 
         return (all_p1, all_p2, protected_p1, protected_p2, half_protected_p1, half_protected_p2, unprotected_p1, unprotected_p2)  
 
-    def addPositionsInRadius(self, position, radius):
-        new_positions = []
-        for i in range(position[0] - radius, position[0] + radius):
-            for j in range(position[1] - radius, position[1] + radius + 1):
-                if i < 0 or i >= self.data.board_size:
-                    continue
-                if j < 0 or j >= self.data.board_size:
-                    continue
-                if (i, j) in list(self.data.board.keys()):
-                    continue
-                self.data.board[(i, j)] = 0    
-
-        
     def isLose(self):
         if self.data.num_player_2_captures >= self.data.captures_to_win:
             return True
-        p2 = self.getRunLengths()[1]
-        if max(p2, default=0) >= self.data.run_len_to_win:
+        if self.data.winning_runs[1] > 0: # player 2 has a run of run_len_to_win
             return True
-        if self.data.turn == 0 and len(playerRules.getLegalActions(self, 0)) == 0:
+        if self.data.turn == 0 and len(self.data.stones) == len(self.data.board): # board full
             return True
         return False
 
     def isWin(self):
         if self.data.num_player_1_captures >= self.data.captures_to_win:
             return True
-        p1 = self.getRunLengths()[0]
-        if max(p1, default=0) >= self.data.run_len_to_win:
+        if self.data.winning_runs[0] > 0: # player 1 has a run of run_len_to_win
             return True
-        if self.data.turn == 1 and len(playerRules.getLegalActions(self, 1)) == 0:
+        if self.data.turn == 1 and len(self.data.stones) == len(self.data.board): # board full
             return True
         return False
         
     def deepCopyData(self):
-        data = copy.deepcopy(self.data)
-        return data
+        return self.data.copy()
+
 
+    def getHash(self):
+        """
+        Returns the zobrist key of the position: the board, both capture counts
+        and the agent to move. The board part is updated on every cell write,
+        so this is O(1).
+        """
+        (cell_keys, capture_keys, turn_key) = self.data.zobrist
+        key = self.data.hash \
+            ^ capture_keys[0][int(self.data.num_player_1_captures)] \
+            ^ capture_keys[1][int(self.data.num_player_2_captures)]
+        if self.data.turn == 1:
+            key ^= turn_key
+        return key
+
+    def getCanonicalHash(self):
+        """
+        Returns (key, symmetry): the smallest getHash over the eight symmetric
+        images of the position, which is the same for every position of a
+        symmetry class, and the index into tables.SYMMETRIES of the symmetry
+        that maps this position to that image. O(1), like getHash.
+        """
+        hashes = self.data.symmetry_hashes
+        symmetry = min(range(8), key=hashes.__getitem__)
+        return (hashes[symmetry] ^ self.getHash() ^ self.data.hash, symmetry)
 
     def __eq__( self, other ):
         """
         Allows two states to be compared.
         """
         if other is None: return False
-        return self.data == other.data
+        return self.data.board == other.data.board \
+            and self.data.num_player_1_captures == other.data.num_player_1_captures \
+            and self.data.num_player_2_captures == other.data.num_player_2_captures \
+            and self.data.turn == other.data.turn
 
     def __hash__( self ):
         """
         Allows states to be keys of dictionaries.
         """
-        return hash( self.data )
+        return self.getHash()
 
     def __str__(self):
        
-        board_grid = [[0 for i in range(self.data.board_size)] for j in range(self.data.board_size)]
-        for (location, val) in self.data.board.items():
-            board_grid[location[0]][location[1]] = val
-            
+        size = self.data.board_size
+        board_grid = [[self.data.board[i * size + j] for j in range(size)] for i in range(size)]
+
         board_str = " _ "
         for i in range(self.data.board_size):
             if i < 10:
@@ -299,87 +458,127 @@ class playerRules:
     @staticmethod
     def getLegalActions(state, agentIndex):
         """
-        Returns a list of possible actions.
+        Returns a list of possible actions: every empty cell, in board order.
         """
-        if agentIndex == 1:
-            possibleActions = [loc for (loc, val) in state.data.board.items() if val == 0]
-        else:
-            possibleActions = []
-            for i in range(state.data.board_size):
-                for j in range(state.data.board_size):
-                    if (i, j) in list(state.data.board.keys()):
-                        if state.data.board[(i, j)] == 0:
-                            possibleActions.append((i, j))
-                    else:
-                        possibleActions.append((i, j))
-        return possibleActions
+        size = state.data.board_size
+        board = state.data.board
+        return [divmod(idx, size) for idx in range(len(board)) if board[idx] == EMPTY]
+
+    @staticmethod
+    def getCandidateActions(state, agentIndex):
+        """
+        Returns the empty cells within candidate_radius of a stone, in board
+        order. Falls back to the centre on an empty board and to every empty
+        cell if the stones' surroundings are full.
+        """
+        size = state.data.board_size
+        if state.data.candidates:
+            return [divmod(idx, size) for idx in sorted(state.data.candidates)]
+        if not state.data.stones:
+            return [(size // 2, size // 2)]
+        return playerRules.getLegalActions(state, agentIndex)
 
     @staticmethod
     def applyAction(state, action, agentIndex):
+        """
+        Places the agent's stone, resolves captures and passes the turn. Returns
+        an undo record for playerRules.undoAction.
+        """
         try:
             action = tuple(action)
-            assert(action[0] < state.data.board_size)
-            assert(action[1] < state.data.board_size)
-            if action in list(state.data.board.keys()):
-                assert(state.data.board[action] == 0)
-            if agentIndex == 0:  
-                state.data.board[action] = agentIndex + 1  
-                positions_freed = playerRules.is_capture(state, action, agentIndex)
-                num_captures = len(positions_freed) / 2
-                if agentIndex == 0:
-                    state.data.num_player_1_captures += num_captures
-                else:
-                    state.data.num_player_2_captures += num_captures
-                for position in positions_freed: # free positions on board
-                    state.data.board[position] = 0
-
-                state.addPositionsInRadius(action, 2)
+            size = state.data.board_size
+            assert(action[0] < size and action[0] >= 0)
+            assert(action[1] < size and action[1] >= 0)
+            board = state.data.board
+            idx = action[0] * size + action[1]
+            assert(board[idx] == EMPTY)
+            record = (idx, agentIndex, state.data.num_player_1_captures,
+                      state.data.num_player_2_captures, state.data.turn, state.data.run_counts[:],
+                      state.data.winning_runs[:], state.data.hash, state.data.symmetry_hashes)
+            state.setBoardPosition(action[0], action[1], agentIndex + 1)
+            state.data.num_pieces[agentIndex] += 1
+            positions_freed = playerRules.is_capture(state, action, agentIndex)
+            num_captures = len(positions_freed) / 2
+            if agentIndex == 0:
+                state.data.num_player_1_captures += num_captures
             else:
-                state.data.board[action] = agentIndex + 1  
-                positions_freed = playerRules.is_capture(state, action, agentIndex)
-                num_captures = len(positions_freed) / 2
-                if agentIndex == 0:
-                    state.data.num_player_1_captures += num_captures
-                else:
-                    state.data.num_player_2_captures += num_captures
-                for position in positions_freed: # free positions on board
-                    state.data.board[position] = 0
+                state.data.num_player_2_captures += num_captures
+            for position in positions_freed: # free positions on board
+                state.setBoardPosition(position[0], position[1], EMPTY)
+            state.data.num_pieces[1 - agentIndex] -= len(positions_freed)
+            state.data.turn = 1 - agentIndex
         except:
             raise Exception("Invalid move")
+        return record + (positions_freed,)
+
+    @staticmethod
+    def undoAction(state, record):
+        """
+        Reverts an action using the record returned by applyAction.
+        """
+        (idx, agentIndex, p1_captures, p2_captures, turn, run_counts, winning_runs, board_hash,
+         symmetry_hashes, positions_freed) = record
+        size = state.data.board_size
+        board = state.data.board
+        for position in positions_freed: # restore captured stones
+            board[position[0] * size + position[1]] = 2 - agentIndex
+            state.updateMoveIndex(position[0] * size + position[1], 2 - agentIndex)
+        state.data.num_pieces[1 - agentIndex] += len(positions_freed)
+        board[idx] = EMPTY
+        state.updateMoveIndex(idx, EMPTY)
+        state.data.num_pieces[agentIndex] -= 1
+        state.data.num_player_1_captures = p1_captures
+        state.data.num_player_2_captures = p2_captures
+        state.data.turn = turn
+        state.data.run_counts = run_counts
+        state.data.winning_runs = winning_runs
+        state.data.hash = board_hash
+        state.data.symmetry_hashes = symmetry_hashes
         
     @staticmethod
     def is_capture(state, action, agentIndex):
         """
         determine whether a move creates a capture. Returns a list of liberated 
         gridpoints to be reset to 0.
+
+        Only the rays from captureRays are checked: the directions with three
+        cells on the board, so no bounds checks are needed. The result is the
+        positions_freed of the undo record, so undoAction can restore them.
         """
-        # list of 8 directions in which to check for a capture, defined as the 
-        # update values for a given position 
-        directions = [(-1, 0), (-1, -1), (0, -1), # left, up left, up
-                      (1, -1), (1, 0), (1, 1), # up right, right, down right
-                      (0, 1), (-1, 1)] # down, down left
+        size = state.data.board_size
+        board = state.data.board
+        # a capture is two opponent stones closed off by one of the agent's own
+        own = 1 if agentIndex == 0 else 2
+        opponent = 3 - own
         positions_freed = []
-        # this template is what a capture looks like in any direction from starting
-        if agentIndex == 0:
-            capture_template = [2, 2, 1] 
-        else:
-            capture_template = [1, 1, 2] 
-
-        for direction in directions:
-            position_vals = []
-            positions = []
-            for i in range(1, 4): # move three along direction, sampling positions
-                new_x = action[0] + (direction[0] * i)
-                new_y = action[1] + (direction[1] * i)
-                try:
-                    position_vals.append(state.getBoardPosition(new_x, new_y))
-                    positions.append((new_x, new_y))
-                except: # position out of bounds
-                    break
-            if position_vals == capture_template: #capture along direction
-                positions_freed += [i for i in positions[:-1]]
+        for (first, second, third, first_cell, second_cell) in captureRays(size)[action[0] * size + action[1]]:
+            if board[first] == opponent and board[second] == opponent and board[third] == own:
+                positions_freed.append(first_cell)
+                positions_freed.append(second_cell)
         return positions_freed
 
+    @staticmethod
+    def runLengthThrough(state, action, agentIndex):
+        """
+        Returns the longest run the agent would have through the empty cell
+        action if it played there.
+        """
+        size = state.data.board_size
+        board = state.data.board
+        player = agentIndex + 1
+        longest = 0
+        for (dx, dy) in ((1, 0), (1, 1), (0, 1), (-1, 1)):
+            run_length = 1
+            for sign in (1, -1):
+                x = action[0] + sign * dx
+                y = action[1] + sign * dy
+                while 0 <= x < size and 0 <= y < size and board[x * size + y] == player:
+                    run_length += 1
+                    x += sign * dx
+                    y += sign * dy
+            longest = max(longest, run_length)
+        return longest
+
 
 if __name__ == '__main__':
     import time
@@ -0,0 +1,321 @@
+# persistent.py
+# --------------
+# An immutable game state for agents that keep many positions alive at once.
+
+from array import array
+from functools import lru_cache
+
+import features
+from game import EMPTY
+from pente import GameState
+from tables import zobristKeys, captureRays, lines, neighbourhoods
+
+# every CHECKPOINT_INTERVAL plies a state stores its whole board and candidate
+# frontier, so reading a cell never walks more than that many deltas
+CHECKPOINT_INTERVAL = 8
+
+
+class Rules:
+    """
+    The configuration of a game and the lookup tables that go with it. All
+    states of a game share one Rules object.
+    """
+    __slots__ = ('board_size', 'captures_to_win', 'run_len_to_win', 'candidate_radius', 'zobrist',
+                 'capture_rays', 'lines', 'neighbourhoods')
+
+    def __init__(self, board_size, captures_to_win, run_len_to_win, candidate_radius):
+        self.board_size = board_size
+        self.captures_to_win = captures_to_win
+        self.run_len_to_win = run_len_to_win
+        self.candidate_radius = candidate_radius
+        self.zobrist = zobristKeys(board_size, captures_to_win)
+        self.capture_rays = captureRays(board_size)
+        self.lines = lines(board_size)
+        self.neighbourhoods = neighbourhoods(board_size, candidate_radius)
+
+@lru_cache(maxsize=None)
+def rulesFor(board_size=9, captures_to_win=5, run_len_to_win=5, candidate_radius=2):
+    return Rules(board_size, captures_to_win, run_len_to_win, candidate_radius)
+
+
+class PersistentState:
+    """
+    An immutable GameState. A successor records only what its move changed
+    (the placed stone and the captured cells) on top of its parent, so the
+    parent is left untouched and a retained node costs a few hundred bytes.
+    Reading a cell walks the deltas back to the nearest stored board.
+    generateSuccessor does a constant amount of work, except on every
+    CHECKPOINT_INTERVAL-th ply, where it copies the board and frontier, so
+    its cost is constant amortized over a line of play.
+
+    The query methods match GameState's, so betterEvaluationFunction and
+    MoveOrderer work on either, and getHash gives the same keys, so
+    transposition tables do too. getCandidateActions and getRunCounts replay
+    the deltas since the last checkpoint; getRunCounts then scans the board
+    with features.runCounts rather than keeping counts in every node.
+    Opening books and the NumPy evaluations read GameStateData and canonical
+    hashes directly and need toGameState. fromGameState converts the other
+    way.
+    """
+    __slots__ = ('rules', 'parent', 'cells', 'board', 'frontier', 'depth', 'captures', 'pieces', 'turn', 'hash',
+                 'run_winner')
+
+    def __init__(self, rules, parent, cells, board, depth, captures, pieces, turn, board_hash, run_winner,
+                 frontier=None):
+        self.rules = rules
+        self.parent = parent
+        self.cells = cells # ((index, value), ...) written by the move that led here
+        self.board = board # the whole board as bytes at checkpoints, else None
+        self.frontier = frontier # the candidate cell indices as an array at checkpoints, else None
+        self.depth = depth
+        self.captures = captures
+        self.pieces = pieces
+        self.turn = turn
+        self.hash = board_hash
+        self.run_winner = run_winner # agent with a run of run_len_to_win, or None
+
+    @staticmethod
+    def fromGameState(state):
+        data = state.data
+        rules = rulesFor(data.board_size, data.captures_to_win, data.run_len_to_win, data.candidate_radius)
+        if data.winning_runs[0] > 0:
+            run_winner = 0
+        elif data.winning_runs[1] > 0:
+            run_winner = 1
+        else:
+            run_winner = None
+        return PersistentState(rules, None, (), bytes(data.board), 0,
+                               (int(data.num_player_1_captures), int(data.num_player_2_captures)),
+                               tuple(data.num_pieces), data.turn, data.hash, run_winner,
+                               array('H', sorted(data.candidates)))
+
+    @staticmethod
+    def initial(board_size=9, captures_to_win=5, run_len_to_win=5, candidate_radius=2):
+        return PersistentState(rulesFor(board_size, captures_to_win, run_len_to_win, candidate_radius), None, (),
+                               bytes(board_size * board_size), 0, (0, 0), (0, 0), 0, 0, None, array('H'))
+
+    def toGameState(self):
+        """
+        Returns a mutable GameState of this position.
+        """
+        rules = self.rules
+        state = GameState(rules.board_size, rules.captures_to_win, rules.run_len_to_win,
+                          candidate_radius=rules.candidate_radius)
+        board = self.getBoard()
+        for idx in range(len(board)):
+            if board[idx] != EMPTY:
+                state.setBoardPosition(idx // rules.board_size, idx % rules.board_size, board[idx])
+        state.data.num_pieces = list(self.pieces)
+        state.data.num_player_1_captures = self.captures[0]
+        state.data.num_player_2_captures = self.captures[1]
+        state.data.turn = self.turn
+        return state
+
+    def cell(self, idx):
+        """
+        Returns the value of the cell at index idx.
+        """
+        node = self
+        while node.board is None:
+            for (i, value) in node.cells:
+                if i == idx:
+                    return value
+            node = node.parent
+        return node.board[idx]
+
+    def getBoard(self):
+        """
+        Returns the whole board as a flat bytearray, like GameState.getBoard.
+        """
+        deltas = []
+        node = self
+        while node.board is None:
+            deltas.append(node.cells)
+            node = node.parent
+        board = bytearray(node.board)
+        for cells in reversed(deltas):
+            for (idx, value) in cells:
+                board[idx] = value
+        return board
+
+    def boardAndFrontier(self):
+        """
+        Returns the board and the set of candidate cells: the empty cells
+        within candidate_radius of a stone. The frontier of the last
+        checkpoint grows by the neighbourhoods of the stones placed since;
+        only the neighbourhoods of captured stones need checking again.
+        """
+        deltas = []
+        node = self
+        while node.board is None:
+            deltas.append(node.cells)
+            node = node.parent
+        board = bytearray(node.board)
+        candidates = set(node.frontier)
+        recheck = set()
+        neighbourhoods = self.rules.neighbourhoods
+        for cells in reversed(deltas):
+            for (idx, value) in cells:
+                board[idx] = value
+                if value == EMPTY:
+                    recheck.update(neighbourhoods[idx])
+                else:
+                    candidates.update(neighbourhoods[idx])
+        candidates |= recheck
+        candidates = {idx for idx in candidates if board[idx] == EMPTY
+                      and (idx not in recheck or any(board[i] != EMPTY for i in neighbourhoods[idx]))}
+        return (board, candidates)
+
+    def getBoardPosition(self, x, y):
+        size = self.rules.board_size
+        assert(x < size and x >= 0)
+        assert(y < size and y >= 0)
+        return self.cell(x * size + y)
+
+    def generateSuccessor(self, agentIndex, action):
+        """
+        Returns the state after the agent plays action; this state is unchanged.
+        """
+        if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+        rules = self.rules
+        size = rules.board_size
+        (x, y) = action
+        if not (0 <= x < size and 0 <= y < size) or self.cell(x * size + y) != EMPTY:
+            raise Exception("Invalid move")
+        idx = x * size + y
+        own = agentIndex + 1
+        opponent = 3 - own
+        (cell_keys, capture_keys, turn_key) = rules.zobrist
+
+        cells = [(idx, own)]
+        board_hash = self.hash ^ cell_keys[own][idx]
+        for (first, second, third, first_cell, second_cell) in rules.capture_rays[idx]:
+            if self.cell(first) == opponent and self.cell(second) == opponent and self.cell(third) == own:
+                cells.append((first, EMPTY))
+                cells.append((second, EMPTY))
+                board_hash ^= cell_keys[opponent][first] ^ cell_keys[opponent][second]
+        freed = len(cells) - 1
+
+        captures = self.captures
+        pieces = self.pieces
+        if freed:
+            captures = (captures[0] + freed // 2, captures[1]) if agentIndex == 0 \
+                else (captures[0], captures[1] + freed // 2)
+        pieces = (pieces[0] + 1, pieces[1] - freed) if agentIndex == 0 else (pieces[0] - freed, pieces[1] + 1)
+
+        # a new run can only go through the placed stone; captured cells held
+        # opponent stones, so reading them from this state is still right
+        run_winner = self.run_winner
+        if run_winner is None:
+            for (line, position) in rules.lines[idx]:
+                start = position
+                while start > 0 and self.cell(line[start - 1]) == own:
+                    start -= 1
+                stop = position + 1
+                while stop < len(line) and self.cell(line[stop]) == own:
+                    stop += 1
+                if stop - start >= rules.run_len_to_win:
+                    run_winner = agentIndex
+                    break
+
+        depth = self.depth + 1
+        child = PersistentState(rules, self, tuple(cells), None, depth, captures, pieces, 1 - agentIndex,
+                                board_hash, run_winner)
+        if depth % CHECKPOINT_INTERVAL == 0:
+            (board, candidates) = child.boardAndFrontier()
+            child.board = bytes(board)
+            child.frontier = array('H', sorted(candidates))
+        return child
+
+    def getLegalActions(self, agentIndex=0):
+        if self.isWin() or self.isLose(): return []
+        size = self.rules.board_size
+        board = self.getBoard()
+        return [divmod(idx, size) for idx in range(len(board)) if board[idx] == EMPTY]
+
+    def getCandidateActions(self, agentIndex=0):
+        """
+        Returns the empty cells within candidate_radius of a stone, in board
+        order, with the same fallbacks as GameState.getCandidateActions.
+        """
+        if self.isWin() or self.isLose(): return []
+        size = self.rules.board_size
+        (board, candidates) = self.boardAndFrontier()
+        if candidates:
+            return [divmod(idx, size) for idx in sorted(candidates)]
+        if self.pieces[0] + self.pieces[1] == 0:
+            return [(size // 2, size // 2)]
+        return self.getLegalActions(agentIndex)
+
+    def getNumPieces(self, agentIndex):
+        return self.pieces[agentIndex]
+
+    def getNumCaptures(self, agentIndex):
+        return self.captures[agentIndex]
+
+    def getCapturesAt(self, action, agentIndex):
+        """
+        Returns the stones the agent would capture by playing the empty cell action.
+        """
+        size = self.rules.board_size
+        own = agentIndex + 1
+        opponent = 3 - own
+        positions_freed = []
+        for (first, second, third, first_cell, second_cell) in self.rules.capture_rays[action[0] * size + action[1]]:
+            if self.cell(first) == opponent and self.cell(second) == opponent and self.cell(third) == own:
+                positions_freed.append(first_cell)
+                positions_freed.append(second_cell)
+        return positions_freed
+
+    def getRunLengthThrough(self, action, agentIndex):
+        """
+        Returns the longest run the agent would make by playing the empty cell action.
+        """
+        own = agentIndex + 1
+        longest = 0
+        for (line, position) in self.rules.lines[action[0] * self.rules.board_size + action[1]]:
+            start = position
+            while start > 0 and self.cell(line[start - 1]) == own:
+                start -= 1
+            stop = position + 1
+            while stop < len(line) and self.cell(line[stop]) == own:
+                stop += 1
+            longest = max(longest, stop - start)
+        return longest
+
+    def getRunCounts(self):
+        """
+        Returns the run counts of GameState.getRunCounts, scanning the board.
+        """
+        rules = self.rules
+        padded = features.paddedBoard(self.getBoard(), rules.board_size, rules.run_len_to_win)
+        return features.runCounts(padded, features.paddingFor(rules.run_len_to_win)).tolist()
+
+    def isFull(self):
+        return self.pieces[0] + self.pieces[1] == self.rules.board_size ** 2
+
+    def isWin(self):
+        return self.captures[0] >= self.rules.captures_to_win or self.run_winner == 0 \
+            or (self.turn == 1 and self.isFull())
+
+    def isLose(self):
+        return self.captures[1] >= self.rules.captures_to_win or self.run_winner == 1 \
+            or (self.turn == 0 and self.isFull())
+
+    def getHash(self):
+        """
+        Returns the zobrist key of the position, equal to GameState.getHash.
+        """
+        (cell_keys, capture_keys, turn_key) = self.rules.zobrist
+        key = self.hash ^ capture_keys[0][self.captures[0]] ^ capture_keys[1][self.captures[1]]
+        if self.turn == 1:
+            key ^= turn_key
+        return key
+
+    def __eq__(self, other):
+        if not isinstance(other, PersistentState): return False
+        return self.rules is other.rules and self.captures == other.captures and self.turn == other.turn \
+            and self.hash == other.hash and self.getBoard() == other.getBoard()
+
+    def __hash__(self):
+        return self.getHash()
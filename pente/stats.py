@@ -0,0 +1,100 @@
+# stats.py
+# --------
+import time
+from collections import Counter
+
+
+class SearchStats:
+    """
+    Counters and timings for one move of a search agent.
+
+    nodes counts every position the search visits and leaves the ones it
+    evaluates. cutoffs counts beta cutoffs by remaining depth. The times split
+    the search between move generation (the candidate lists), successor
+    creation (makeMove and undoMove) and evaluation; totalTime covers the
+    whole move, so the rest is bookkeeping such as table probes and the move
+    ordering, which runs lazily as children are drawn.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = Counter()
+        self.tableProbes = 0
+        self.tableHits = 0
+        self.tableCutoffs = 0
+        self.researches = 0 # null-window searches repeated with the full window
+        self.generationTime = 0.0
+        self.successorTime = 0.0
+        self.evaluationTime = 0.0
+        self.totalTime = 0.0
+        self.depth = None # deepest completed search depth
+        self.iterationNodes = [] # nodes of each completed iteration
+        self.ponderHit = False # the search ran while the opponent was thinking
+
+    def evaluate(self, evaluationFunction, gameState):
+        """
+        Evaluates a leaf, counting and timing the call.
+        """
+        tic = time.perf_counter()
+        value = evaluationFunction(gameState)
+        self.evaluationTime += time.perf_counter() - tic
+        self.leaves += 1
+        return value
+
+    def merge(self, other):
+        """
+        Adds the counters of other, e.g. those of a worker process.
+        """
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        self.cutoffs.update(other.cutoffs)
+        self.tableProbes += other.tableProbes
+        self.tableHits += other.tableHits
+        self.tableCutoffs += other.tableCutoffs
+        self.researches += other.researches
+        self.generationTime += other.generationTime
+        self.successorTime += other.successorTime
+        self.evaluationTime += other.evaluationTime
+
+    def effectiveBranchingFactor(self):
+        """
+        Returns the growth in nodes from the second deepest to the deepest
+        iteration, or the plies-th root of the nodes of a single iteration.
+        """
+        if not self.iterationNodes:
+            return None
+        if len(self.iterationNodes) >= 2 and self.iterationNodes[-2] > 0:
+            return self.iterationNodes[-1] / self.iterationNodes[-2]
+        plies = self.depth + 1 # the root move is a ply above depth
+        return self.iterationNodes[-1] ** (1 / plies)
+
+    def asDict(self):
+        """
+        Returns the stats as a JSON-ready dict, for structured logging.
+        """
+        return {
+            'nodes': self.nodes,
+            'leaves': self.leaves,
+            'cutoffs': {str(depth): count for (depth, count) in sorted(self.cutoffs.items())},
+            'table_probes': self.tableProbes,
+            'table_hits': self.tableHits,
+            'table_cutoffs': self.tableCutoffs,
+            'researches': self.researches,
+            'depth': self.depth,
+            'iteration_nodes': self.iterationNodes,
+            'effective_branching_factor': self.effectiveBranchingFactor(),
+            'generation_time': self.generationTime,
+            'successor_time': self.successorTime,
+            'evaluation_time': self.evaluationTime,
+            'total_time': self.totalTime,
+            'ponder_hit': self.ponderHit,
+        }
+
+    def __str__(self):
+        ebf = self.effectiveBranchingFactor()
+        return (f"depth {self.depth}: {self.nodes} nodes, {self.leaves} leaves, "
+                f"{sum(self.cutoffs.values())} cutoffs, {self.tableHits}/{self.tableProbes} table hits, "
+                f"ebf {'-' if ebf is None else f'{ebf:.2f}'}, {self.totalTime:.3f}s "
+                f"(generation {self.generationTime:.3f}s, successors {self.successorTime:.3f}s, "
+                f"evaluation {self.evaluationTime:.3f}s)")
@@ -0,0 +1,134 @@
+# tables.py
+# --------------
+# Lookup tables that depend only on the board configuration. They are built
+# once per configuration and cached, so every state on a board shares them.
+
+import random
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def zobristKeys(board_size, captures_to_win):
+    """
+    Returns the Zobrist keys for a board configuration as a tuple of
+
+        cell_keys[cell value][cell index]
+        capture_keys[agentIndex][number of captures]
+        turn_key, xor-ed in when agent 1 is to move
+
+    The generator is seeded from the configuration so keys are identical in
+    every process, which lets worker processes and saved files share hashes.
+    """
+    rng = random.Random(f"zobrist {board_size} {captures_to_win}")
+    num_cells = board_size * board_size
+    cell_keys = [[0] * num_cells] + [[rng.getrandbits(64) for idx in range(num_cells)] for player in range(2)]
+    # one move captures at most 8 pairs, so counts stay below captures_to_win + 8
+    capture_keys = [[0] + [rng.getrandbits(64) for count in range(captures_to_win + 8)] for player in range(2)]
+    turn_key = rng.getrandbits(64)
+    return (cell_keys, capture_keys, turn_key)
+
+# the eight symmetries of the square board, as maps of (x, y) for a board of
+# size n: the identity, three rotations, and four reflections
+SYMMETRIES = (
+    lambda x, y, n: (x, y),
+    lambda x, y, n: (y, n - 1 - x),
+    lambda x, y, n: (n - 1 - x, n - 1 - y),
+    lambda x, y, n: (n - 1 - y, x),
+    lambda x, y, n: (n - 1 - x, y),
+    lambda x, y, n: (x, n - 1 - y),
+    lambda x, y, n: (y, x),
+    lambda x, y, n: (n - 1 - y, n - 1 - x),
+)
+# INVERSE_SYMMETRY[t] undoes symmetry t
+INVERSE_SYMMETRY = (0, 3, 2, 1, 4, 5, 6, 7)
+
+@lru_cache(maxsize=None)
+def symmetries(board_size):
+    """
+    Returns, for each of the SYMMETRIES, the cell permutation it induces:
+    symmetries(n)[t][idx] is the index of the cell that idx maps to.
+    """
+    return tuple(tuple(x * board_size + y
+                       for (x, y) in (symmetry(idx // board_size, idx % board_size, board_size)
+                                      for idx in range(board_size * board_size)))
+                 for symmetry in SYMMETRIES)
+
+@lru_cache(maxsize=None)
+def symmetryKeys(board_size, captures_to_win):
+    """
+    Returns the zobrist cell keys seen through each symmetry:
+    symmetryKeys(...)[t][value][idx] is the key of value at the cell idx maps
+    to under symmetry t. Xor-ing these over the board gives the zobrist hash
+    of the transformed position, so all eight can be kept up to date.
+    """
+    cell_keys = zobristKeys(board_size, captures_to_win)[0]
+    return tuple(tuple(tuple(keys[perm[idx]] for idx in range(board_size * board_size)) for keys in cell_keys)
+                 for perm in symmetries(board_size))
+
+@lru_cache(maxsize=None)
+def neighbourhoods(board_size, radius):
+    """
+    Returns, for every cell index, the indices of the cells within radius of it
+    (a square clipped to the board, including the cell itself).
+    """
+    cells = []
+    for x in range(board_size):
+        for y in range(board_size):
+            cells.append(tuple(i * board_size + j
+                               for i in range(max(0, x - radius), min(board_size, x + radius + 1))
+                               for j in range(max(0, y - radius), min(board_size, y + radius + 1))))
+    return cells
+
+# the four line directions, as (dx, dy) steps; the opposite directions walk
+# the same lines backwards
+LINE_DIRECTIONS = ((1, 0), (1, 1), (0, 1), (-1, 1))
+
+@lru_cache(maxsize=None)
+def lines(board_size):
+    """
+    Returns, for every cell index, the four lines through the cell as
+    (line, position) pairs, one per LINE_DIRECTIONS entry: line is the tuple
+    of cell indices along the whole board line, in direction order, and
+    position is where the cell sits in it. Cells on the same line share the
+    tuple.
+    """
+    cells = [[] for idx in range(board_size * board_size)]
+    for (dx, dy) in LINE_DIRECTIONS:
+        for x in range(board_size):
+            for y in range(board_size):
+                if 0 <= x - dx < board_size and 0 <= y - dy < board_size:
+                    continue # not the first cell of its line
+                line = []
+                (cx, cy) = (x, y)
+                while 0 <= cx < board_size and 0 <= cy < board_size:
+                    line.append(cx * board_size + cy)
+                    cx += dx
+                    cy += dy
+                line = tuple(line)
+                for (position, idx) in enumerate(line):
+                    cells[idx].append((line, position))
+    return tuple(tuple(cell) for cell in cells)
+
+# the eight capture directions, in the order playerRules.is_capture reports
+# captured pairs
+CAPTURE_DIRECTIONS = ((-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1))
+
+@lru_cache(maxsize=None)
+def captureRays(board_size):
+    """
+    Returns, for every cell index, the capture rays from the cell: one
+    (first, second, third, first_cell, second_cell) tuple per direction whose
+    three cells all lie on the board. first, second and third are the indices
+    of the cells one, two and three steps away; first_cell and second_cell
+    are the (x, y) of the pair a capture along the ray frees.
+    """
+    rays = []
+    for x in range(board_size):
+        for y in range(board_size):
+            cell = []
+            for (dx, dy) in CAPTURE_DIRECTIONS:
+                if not (0 <= x + 3 * dx < board_size and 0 <= y + 3 * dy < board_size):
+                    continue
+                steps = [(x + i * dx, y + i * dy) for i in (1, 2, 3)]
+                cell.append(tuple(sx * board_size + sy for (sx, sy) in steps) + (steps[0], steps[1]))
+            rays.append(tuple(cell))
+    return tuple(rays)
@@ -0,0 +1,270 @@
+# test_state.py
+# --------------
+# Seeded checks that the incremental bookkeeping of GameState (run counts,
+# make/undo, zobrist and symmetry hashes), the NumPy evaluations and
+# PersistentState agree with recomputing everything from scratch, and that
+# every AlphaBetaAgent variant picks from plain minimax's best moves.
+#
+#     python -m pytest test_state.py
+
+import random
+import unittest
+from unittest import mock
+
+from agents import AlphaBetaAgent, betterEvaluationFunction, vectorizedEvaluationFunction, batchEvaluationFunction
+from game import EMPTY
+from pente import GameState
+from persistent import PersistentState
+from tables import symmetries
+
+# (board_size, captures_to_win, run_len_to_win) of the games played
+CONFIGS = ((7, 3, 4), (9, 5, 5), (11, 5, 7))
+GAMES_PER_CONFIG = 6
+# (board_size, captures_to_win, run_len_to_win, candidate_radius) and depth
+# of the compared searches, small enough for plain minimax
+SEARCH_CONFIG = (7, 3, 5, 1)
+SEARCH_DEPTH = 2
+SEARCH_POSITIONS = 6
+
+
+def randomGames(seed=0):
+    """
+    Yields the positions of seeded random games, with the agent to move set,
+    for every configuration. Moves are drawn from the candidates, so stones
+    stay close enough together for runs and captures to happen.
+    """
+    for (board_size, captures_to_win, run_len_to_win) in CONFIGS:
+        for game in range(GAMES_PER_CONFIG):
+            rng = random.Random(f"{seed} {board_size} {game}")
+            state = GameState(board_size, captures_to_win, run_len_to_win)
+            for ply in range(board_size * board_size):
+                state.setTurn(ply % 2)
+                yield state
+                if state.isWin() or state.isLose():
+                    break
+                state = state.generateSuccessor(ply % 2, rng.choice(state.getCandidateActions(ply % 2)))
+
+
+def rebuild(state):
+    """
+    Returns a fresh GameState with the board, captures and turn of state,
+    built from an empty board one cell at a time.
+    """
+    data = state.data
+    fresh = GameState(data.board_size, data.captures_to_win, data.run_len_to_win)
+    for idx in range(len(data.board)):
+        if data.board[idx] != EMPTY:
+            fresh.setBoardPosition(idx // data.board_size, idx % data.board_size, data.board[idx])
+    fresh.data.num_pieces = list(data.num_pieces)
+    fresh.data.num_player_1_captures = data.num_player_1_captures
+    fresh.data.num_player_2_captures = data.num_player_2_captures
+    fresh.data.turn = data.turn
+    return fresh
+
+
+def runCountsFromRunLengths(state):
+    """
+    Returns the run counts the way betterEvaluationFunction computed them
+    from getRunLengths before the counts were kept incrementally.
+    """
+    (all_p1, all_p2, protected_p1, protected_p2, half_protected_p1, half_protected_p2,
+     unprotected_p1, unprotected_p2) = state.getRunLengths()
+    counts = []
+    for runs in ((protected_p1, protected_p2), (half_protected_p1, half_protected_p2),
+                 (unprotected_p1, unprotected_p2)):
+        for run_length in (2, 3, 4):
+            counts += [runs[0].count(run_length), runs[1].count(run_length)]
+    return counts
+
+
+def searchPositions(seed=0):
+    """
+    Returns seeded random positions a few moves into a game, with the agent
+    to move set.
+    """
+    (board_size, captures_to_win, run_len_to_win, candidate_radius) = SEARCH_CONFIG
+    positions = []
+    for game in range(SEARCH_POSITIONS):
+        rng = random.Random(f"{seed} search {game}")
+        state = GameState(board_size, captures_to_win, run_len_to_win, candidate_radius=candidate_radius)
+        for ply in range(3 + game): # either agent may be to move
+            state.setTurn(ply % 2)
+            state = state.generateSuccessor(ply % 2, rng.choice(state.getCandidateActions(ply % 2)))
+        state.setTurn((3 + game) % 2)
+        positions.append(state)
+    return positions
+
+
+def minimax(state, agentIndex, depth):
+    """
+    Returns the value of state with agentIndex to move, searched like
+    AlphaBetaAgent searches it but without pruning, tables or ordering.
+    """
+    if state.isWin() or state.isLose() or depth == 0:
+        return betterEvaluationFunction(state)
+    actions = state.getCandidateActions(agentIndex)
+    if not actions:
+        return betterEvaluationFunction(state)
+    values = [minimax(state.generateSuccessor(agentIndex, action), 1 - agentIndex, depth - 1) for action in actions]
+    return max(values) if agentIndex == 0 else min(values)
+
+
+def minimaxBestMoves(state, depth):
+    """
+    Returns the set of root moves with the best plain minimax value.
+    """
+    agentIndex = state.data.turn
+    actions = state.getCandidateActions(agentIndex)
+    values = [minimax(state.generateSuccessor(agentIndex, action), 1 - agentIndex, depth) for action in actions]
+    best = max(values) if agentIndex == 0 else min(values)
+    return {action for (action, value) in zip(actions, values) if value == best}
+
+
+def bookkeeping(state):
+    """
+    Returns everything makeMove and undoMove update, as comparable values.
+    """
+    data = state.data
+    return (bytes(data.board), data.num_player_1_captures, data.num_player_2_captures, list(data.num_pieces),
+            data.turn, list(data.run_counts), list(data.winning_runs), data.hash, data.symmetry_hashes,
+            set(data.stones), set(data.candidates), bytes(data.influence))
+
+
+class TestIncrementalState(unittest.TestCase):
+
+    def test_run_counts_match_run_lengths(self):
+        for state in randomGames():
+            self.assertEqual(state.getRunCounts(), runCountsFromRunLengths(state))
+
+    def test_make_and_undo_round_trip(self):
+        for state in randomGames():
+            if state.isWin() or state.isLose():
+                continue
+            agentIndex = state.data.turn
+            before = bookkeeping(state)
+            for action in state.getCandidateActions(agentIndex):
+                successor = state.generateSuccessor(agentIndex, action)
+                state.makeMove(agentIndex, action)
+                self.assertEqual(bookkeeping(state), bookkeeping(successor))
+                state.undoMove()
+                self.assertEqual(bookkeeping(state), before)
+
+    def test_hashes_match_rebuilt_state(self):
+        for state in randomGames():
+            fresh = rebuild(state)
+            self.assertEqual(state.getHash(), fresh.getHash())
+            self.assertEqual(state.data.symmetry_hashes, fresh.data.symmetry_hashes)
+            self.assertEqual(state.getCanonicalHash(), fresh.getCanonicalHash())
+            self.assertEqual(state.data.run_counts, fresh.data.run_counts)
+            self.assertEqual(state.data.winning_runs, fresh.data.winning_runs)
+            self.assertEqual((state.isWin(), state.isLose()), (fresh.isWin(), fresh.isLose()))
+
+    def test_symmetric_positions_share_canonical_key(self):
+        for state in randomGames():
+            data = state.data
+            (key, symmetry) = state.getCanonicalHash()
+            for permutation in symmetries(data.board_size):
+                image = GameState(data.board_size, data.captures_to_win, data.run_len_to_win)
+                for idx in data.stones:
+                    image.setBoardPosition(permutation[idx] // data.board_size, permutation[idx] % data.board_size,
+                                           data.board[idx])
+                image.data.num_player_1_captures = data.num_player_1_captures
+                image.data.num_player_2_captures = data.num_player_2_captures
+                image.data.turn = data.turn
+                self.assertEqual(image.getCanonicalHash()[0], key)
+
+
+class TestVectorizedEvaluation(unittest.TestCase):
+
+    def test_vectorized_and_batch_match_scalar(self):
+        states = [state.copy() for state in randomGames()]
+        for state in states:
+            self.assertEqual(vectorizedEvaluationFunction(state), betterEvaluationFunction(state))
+        for (board_size, captures_to_win, run_len_to_win) in CONFIGS:
+            batch = [state for state in states if (state.data.board_size, state.data.run_len_to_win)
+                     == (board_size, run_len_to_win)]
+            (matrix, scores) = batchEvaluationFunction(batch)
+            self.assertEqual(list(scores), [betterEvaluationFunction(state) for state in batch])
+
+
+class TestSearchMatchesMinimax(unittest.TestCase):
+
+    # each variant promises the same choice of moves as plain alpha-beta
+    VARIANTS = {
+        'alphabeta': {},
+        'pvs': {'pvs': True},
+        'aspiration': {'moveTime': 600, 'maxDepth': SEARCH_DEPTH, 'aspiration': 1, 'pvs': True},
+        'workers': {'workers': 2},
+        'evalCacheSize': {'evalCacheSize': 1024},
+        'collectStats': {'collectStats': True},
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        cls.positions = searchPositions()
+        cls.expected = [minimaxBestMoves(state, SEARCH_DEPTH) for state in cls.positions]
+
+    def bestMoves(self, agent, state):
+        """
+        Returns the set of moves the agent chose its move from in state: the
+        tied root moves of its last (deepest) iteration.
+        """
+        calls = []
+        chooseAction = AlphaBetaAgent.chooseAction
+        def record(agent, agentIndex, legalMoves, scores):
+            calls.append((agentIndex, list(legalMoves), list(scores)))
+            return chooseAction(agent, agentIndex, legalMoves, scores)
+        with mock.patch.object(AlphaBetaAgent, 'chooseAction', autospec=True, side_effect=record):
+            action = agent.getAction(state)
+        (agentIndex, legalMoves, scores) = calls[-1]
+        best = max(scores) if agentIndex == 0 else min(scores)
+        moves = {move for (move, score) in zip(legalMoves, scores) if score == best}
+        self.assertIn(action, moves)
+        return moves
+
+    def test_variants_choose_from_minimax_best_moves(self):
+        for (name, kwargs) in self.VARIANTS.items():
+            # one agent for all positions, so tables and caches carry over
+            agent = AlphaBetaAgent('betterEvaluationFunction', depth=SEARCH_DEPTH, progress=False, **kwargs)
+            try:
+                for (position, (state, expected)) in enumerate(zip(self.positions, self.expected)):
+                    with self.subTest(variant=name, position=position):
+                        self.assertEqual(self.bestMoves(agent, state), expected)
+            finally:
+                agent.close()
+
+
+class TestPersistentState(unittest.TestCase):
+
+    def test_persistent_state_matches_game_state(self):
+        # the same seeded games as randomGames, played on both kinds of state
+        for (board_size, captures_to_win, run_len_to_win) in CONFIGS:
+            for game in range(GAMES_PER_CONFIG):
+                rng = random.Random(f"0 {board_size} {game}")
+                state = GameState(board_size, captures_to_win, run_len_to_win)
+                persistent = PersistentState.initial(board_size, captures_to_win, run_len_to_win)
+                for ply in range(board_size * board_size):
+                    agentIndex = ply % 2
+                    state.setTurn(agentIndex)
+                    self.assertEqual(bytes(persistent.getBoard()), bytes(state.data.board))
+                    self.assertEqual(persistent.getCandidateActions(agentIndex),
+                                     sorted(state.getCandidateActions(agentIndex)))
+                    self.assertEqual(persistent.getHash(), state.getHash())
+                    self.assertEqual((persistent.isWin(), persistent.isLose()), (state.isWin(), state.isLose()))
+                    self.assertEqual(persistent.getRunCounts(), state.getRunCounts())
+                    self.assertEqual(betterEvaluationFunction(persistent), betterEvaluationFunction(state))
+                    converted = persistent.toGameState()
+                    self.assertEqual(converted.getHash(), state.getHash())
+                    self.assertEqual(converted.data.run_counts, state.data.run_counts)
+                    self.assertEqual((converted.getNumCaptures(0), converted.getNumCaptures(1)),
+                                     (state.getNumCaptures(0), state.getNumCaptures(1)))
+                    self.assertEqual(PersistentState.fromGameState(state).getHash(), state.getHash())
+                    if state.isWin() or state.isLose():
+                        break
+                    action = rng.choice(state.getCandidateActions(agentIndex))
+                    state = state.generateSuccessor(agentIndex, action)
+                    persistent = persistent.generateSuccessor(agentIndex, action)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# tournament.py
+# -------------
+"""
+Headless self-play tournaments between the agents in agents.py.
+
+Plays games for every pairing of the given agents across a process pool and
+streams one JSON line per finished game, e.g.
+
+    python tournament.py --agents "AlphaBetaAgent:depth=1" randomAgent \\
+        --games 100 --workers 8 --out results.jsonl
+
+An agent is given as a class name from agents.py, optionally followed by
+keyword arguments: "MCTSAgent:playouts=500,rolloutDepth=10". Each pairing
+plays --games games, alternating which agent moves first, and every game is
+seeded from --seed, the pairing and the game number, so a run is repeatable
+for agents without a move time.
+"""
+
+import argparse
+import ast
+import itertools
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import agents
+from game import Game
+from pente import GameState
+
+
+def parseAgentSpec(spec):
+    """
+    Splits "Name:key=value,..." into the agent class name and its keyword
+    arguments. Values are Python literals, or plain strings otherwise.
+    """
+    (name, _, args) = spec.partition(':')
+    kwargs = {}
+    for arg in filter(None, args.split(',')):
+        (key, _, value) = arg.partition('=')
+        try:
+            kwargs[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            kwargs[key.strip()] = value.strip()
+    if not isinstance(getattr(agents, name, None), type):
+        raise ValueError(f"unknown agent {name!r}")
+    return (name, kwargs)
+
+
+def makeAgent(spec):
+    (name, kwargs) = parseAgentSpec(spec)
+    agent = getattr(agents, name)(**kwargs)
+    if hasattr(agent, 'progress'):
+        agent.progress = False
+    return agent
+
+
+def gameSeed(seed, pairing, game):
+    """
+    Returns the seed of one game, derived only from its place in the run.
+    """
+    return random.Random(f"{seed} {pairing} {game}").getrandbits(32)
+
+
+def schedule(specs, games, seed):
+    """
+    Yields the games of a round robin between specs: (pairing, game, seed,
+    seats), where seats[0] moves first and alternates within a pairing.
+    """
+    for (pairing, (a, b)) in enumerate(itertools.combinations(specs, 2)):
+        for game in range(games):
+            seats = (a, b) if game % 2 == 0 else (b, a)
+            yield (pairing, game, gameSeed(seed, pairing, game), seats)
+
+
+def playGame(pairing, game, seed, seats, board_size=9, captures_to_win=5, run_len_to_win=5):
+    """
+    Plays one headless game and returns its record.
+    """
+    random.seed(seed)
+    players = [makeAgent(spec) for spec in seats]
+    tic = time.perf_counter()
+    try:
+        match = Game(GameState(board_size, captures_to_win, run_len_to_win), players, verbose=False)
+        match.run()
+    finally:
+        for player in players:
+            if hasattr(player, 'close'):
+                player.close()
+    data = match.state.data
+    return {
+        'pairing': pairing,
+        'game': game,
+        'seed': seed,
+        'seats': list(seats),
+        'board_size': board_size,
+        'moves': [[agentIndex, x, y] for (agentIndex, (x, y)) in match.moveHistory],
+        'winner': match.winner,
+        'winner_agent': seats[match.winner],
+        'captures': [int(data.num_player_1_captures), int(data.num_player_2_captures)], # counted as floats
+        'move_times': match.moveTimes,
+        'duration': time.perf_counter() - tic,
+    }
+
+
+def runTournament(specs, games, out, workers=None, seed=0, **rules):
+    """
+    Plays the round robin in a process pool and writes each finished game to
+    out as one JSON line, in the order the games finish. Returns the number of
+    wins per agent spec.
+    """
+    for spec in specs:
+        parseAgentSpec(spec) # fail before starting any workers
+    wins = dict.fromkeys(specs, 0)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(playGame, *entry, **rules) for entry in schedule(specs, games, seed)]
+        for future in as_completed(futures):
+            record = future.result()
+            wins[record['winner_agent']] += 1
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+    return wins
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--agents', nargs='+', required=True, help='agent specs, Name[:key=value,...]')
+    parser.add_argument('--games', type=int, default=2, help='games per pairing')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board-size', type=int, default=9)
+    parser.add_argument('--captures-to-win', type=int, default=5)
+    parser.add_argument('--run-len-to-win', type=int, default=5)
+    parser.add_argument('--out', default='-', help='JSONL output file (default: stdout)')
+    args = parser.parse_args()
+    if len(args.agents) < 2:
+        parser.error('at least two agents are needed')
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        wins = runTournament(args.agents, args.games, out, workers=args.workers, seed=args.seed,
+                             board_size=args.board_size, captures_to_win=args.captures_to_win,
+                             run_len_to_win=args.run_len_to_win)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    for (spec, count) in wins.items():
+        print(f"{spec}: {count} wins", file=sys.stderr)
@@ -0,0 +1,50 @@
+# transposition.py
+# --------------
+# A fixed-size transposition table for the search agents.
+
+EXACT = 0
+LOWERBOUND = 1
+UPPERBOUND = 2
+
+class TranspositionTable:
+    """
+    Stores search results keyed by a position's zobrist key (GameState.getHash).
+
+    The table has a fixed number of slots, chosen when it is created, so memory
+    stays bounded however long the game runs. Each slot holds one entry of
+    (key, depth, flag, value, best move, generation). A new result replaces the
+    slot's entry when the slot belongs to the same position, was written during
+    an earlier search, or was searched to no greater depth.
+    """
+
+    def __init__(self, size=2**16):
+        assert(size > 0 and size & (size - 1) == 0) # power of two, so a mask picks the slot
+        self.size = size
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.generation = 0
+
+    def newSearch(self):
+        """
+        Marks the start of a new search. Entries from earlier searches stay
+        readable but are the first to be replaced.
+        """
+        self.generation += 1
+
+    def lookup(self, key):
+        """
+        Returns (depth, flag, value, best move) stored for key, or None.
+        """
+        entry = self.slots[key & self.mask]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1:5]
+
+    def store(self, key, depth, flag, value, move):
+        slot = key & self.mask
+        entry = self.slots[slot]
+        if entry is None or entry[0] == key or entry[5] != self.generation or entry[1] <= depth:
+            self.slots[slot] = (key, depth, flag, value, move, self.generation)
+
+    def clear(self):
+        self.slots = [None] * self.size